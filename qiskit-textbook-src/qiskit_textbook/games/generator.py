@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Generates hello_quantum puzzles, checked to be solvable and graded by the length
+of their shortest solutions.
+
+Each family of puzzles shares a random starting state and gate set. Many random
+walks with those gates are run together, as batched 4x4 products on a stack of
+statevectors, and the states they end in become the targets. Targets are deduplicated
+by a hash of the canonical start, gate set and success condition, and each is graded
+with the solver's graph of the family's reachable states, which is searched only
+once per family. Families are spread over a pool of processes.
+
+    python -m qiskit_textbook.games.generator --count 1000 --processes 4 --output puzzles.json
+
+Each puzzle has the keys of the exercises in hello_qiskit ('initialize',
+'success_condition', 'allowed_gates', 'vi', 'mode' and 'qubit_names'), plus 'eps',
+the tolerance it was graded with, and 'difficulty', the number of moves in its
+shortest solutions. run_game.from_puzzle plays it.
+"""
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+
+import numpy as np
+
+from qiskit_textbook.games.solver import _moves, _matrix, _initial_state, _canonical, _expectations, reachable
+from qiskit_textbook.games.hello_quantum import _PAULI_NAMES
+
+# gates that may be allowed on each qubit, and that may set up the starting state
+_GATES = ['x', 'z', 'h', 'ry(pi/4)', 'cx']
+_INITIAL_GATES = ['x', 'h', 'ry(pi/4)']
+
+# the expectation values shown on the grid of a qubit puzzle, used as success conditions
+_SHOWN = [pauli for pauli in _PAULI_NAMES if 'Y' not in pauli]
+
+
+def _family(rng):
+    # A random starting state and gate set: (initialize, allowed_gates).
+    initialize = [[str(rng.choice(_INITIAL_GATES)), str(rng.integers(2))] for _ in range(rng.integers(3))]
+    allowed_gates = {'0': {}, '1': {}, 'both': {}}
+    while not any(allowed_gates.values()):
+        for q in ['0', '1']:
+            for gate in rng.choice(_GATES, size=rng.integers(1, 4), replace=False):
+                allowed_gates[q][str(gate)] = 0
+        if rng.random() < 0.5:
+            allowed_gates['both']['cz'] = 0
+    return initialize, allowed_gates
+
+
+def _walks(rng, start, matrices, walks, max_moves):
+    """
+    Runs `walks` random walks of 1 to max_moves moves from `start` together.
+
+        Returns:
+            ndarray: The state each walk ends in, one per row.
+    """
+    states = np.tile(start, (walks, 1))
+    lengths = rng.integers(1, max_moves + 1, size=walks)
+    for step in range(max_moves):
+        moving = lengths > step
+        choices = rng.integers(len(matrices), size=moving.sum())
+        states[moving] = np.einsum('wij,wj->wi', matrices[choices], states[moving])
+    return states
+
+
+def _key(start, allowed_gates, success_condition):
+    # Puzzles with the same key are the same puzzle.
+    description = json.dumps([start, allowed_gates, sorted(success_condition.items())], sort_keys=True)
+    return blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def _generate(seed, count, max_moves=6, walks=64, eps=0.1, mode='circle'):
+    """
+    Generates about `count` puzzles (some may be duplicates), with the random seed `seed`.
+
+        Returns:
+            list: (key, puzzle) pairs.
+    """
+    rng = np.random.default_rng(seed)
+    puzzles = []
+    while len(puzzles) < count:
+        initialize, allowed_gates = _family(rng)
+        moves, _, _ = _moves(allowed_gates)
+        matrices = np.array([_matrix(gate, q) for gate, q in moves])
+        start = _initial_state(initialize)
+        _, (start_key,) = _canonical(start)
+
+        graph = reachable(initialize, allowed_gates, max_moves)
+        targets, _ = _canonical(_walks(rng, start, matrices, walks, max_moves))
+        rho = np.round(_expectations(targets), 4)
+        seen = set()
+        for values in rho:
+            success_condition = {pauli: float(values[_PAULI_NAMES.index(pauli)]) + 0.0 for pauli in _SHOWN}
+            key = _key(start_key.hex(), allowed_gates, success_condition)
+            if key in seen:
+                continue
+            seen.add(key)
+            difficulty = int(graph.distances(success_condition, eps)[0])
+            # targets already met at the start aren't puzzles, and walks always reach theirs
+            if difficulty <= 0:
+                continue
+            puzzles.append((key, {'initialize': initialize, 'success_condition': success_condition,
+                                  'allowed_gates': allowed_gates, 'vi': [[], True, True], 'mode': mode,
+                                  'qubit_names': {'0': 'q[0]', '1': 'q[1]'}, 'eps': eps,
+                                  'difficulty': difficulty}))
+    return puzzles
+
+
+def generate(count, seed=None, processes=None, max_moves=6, eps=0.1, mode='circle'):
+    """
+    Generates distinct, solvable puzzles.
+
+        count (int): Number of puzzles.
+        seed (int): Seed for the random walks (random if None).
+        processes (int): Size of the process pool (Python's default if None, and
+                         none at all if 1).
+        max_moves (int): Longest random walk, and so the greatest difficulty.
+        eps (float): How close to the success condition counts as solved, as for run_game.
+        mode (str): The mode of the puzzles, as for run_game.
+
+        Returns:
+            list: The puzzles, sorted by difficulty.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(max(1, processes or 1)*4)
+    chunk = -(-count//len(seeds))
+    puzzles = {}
+    while len(puzzles) < count:
+        args = [(s, chunk, max_moves, 64, eps, mode) for s in seeds]
+        if processes == 1:
+            results = [_generate(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                results = list(pool.map(_generate, *zip(*args)))
+        for result in results:
+            for key, puzzle in result:
+                puzzles.setdefault(key, puzzle)
+        # fresh seeds, for the rounds needed to make up for duplicates
+        seeds = [s.spawn(1)[0] for s in seeds]
+    return sorted(list(puzzles.values())[:count], key=lambda puzzle: puzzle['difficulty'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=100, help='number of puzzles (default: 100)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--processes', type=int, help='size of the process pool')
+    parser.add_argument('--max-moves', type=int, default=6, help='greatest difficulty (default: 6)')
+    parser.add_argument('--eps', type=float, default=0.1,
+                        help='how close to the success condition counts as solved (default: 0.1)')
+    parser.add_argument('--mode', default='circle', help="mode of the puzzles (default: 'circle')")
+    parser.add_argument('--output', help='JSON file for the puzzles (default: stdout)')
+    args = parser.parse_args(argv)
+
+    puzzles = generate(args.count, args.seed, args.processes, args.max_moves, args.eps, args.mode)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        json.dump(puzzles, output, indent=1)
+        output.write('\n')
+    finally:
+        if args.output:
+            output.close()
+    difficulties = np.bincount([puzzle['difficulty'] for puzzle in puzzles])
+    print("%i puzzles, by difficulty: %s" % (len(puzzles), ", ".join(
+        "%i: %i" % (d, n) for d, n in enumerate(difficulties) if n)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,90 @@
 #!/usr/bin/env python3
 
 import copy
-from io import BytesIO
+import threading
+from hashlib import blake2b
 
-from qiskit import Aer
 from qiskit import ClassicalRegister, QuantumRegister, QuantumCircuit
-from qiskit import execute
-from qiskit.quantum_info import Statevector
 import numpy as np
-import matplotlib.pyplot as plt
 from matplotlib.patches import Circle, Rectangle
 from ipywidgets import widgets
 from IPython.display import display
 
-from qiskit_textbook.widgets._helpers import _img
+from qiskit_textbook.widgets._helpers import _img, _figure, _lru, executor
+from qiskit_textbook.instrumentation import timed, timer
+from qiskit_textbook.simulator import statevector, execute, apply_gate, tableau
+
+# The observables of a pauli_grid, with the first letter for qubit 0, and their
+# matrices in Qiskit's ordering (qubit 0 as the least significant bit)
+_PAULIS = {'I': np.eye(2), 'X': np.array([[0, 1], [1, 0]]),
+           'Y': np.array([[0, -1j], [1j, 0]]), 'Z': np.diag([1, -1])}
+_PAULI_NAMES = ['XI', 'YI', 'ZI', 'IX', 'IY', 'IZ', 'ZZ', 'ZX', 'XZ', 'XX', 'YY', 'YX', 'YZ', 'XY', 'ZY']
+_PAULI_OPERATORS = np.array([np.kron(_PAULIS[pauli[1]], _PAULIS[pauli[0]]) for pauli in _PAULI_NAMES])
+
+# The gates of the puzzles, by the name used in allowed_gates: the QuantumCircuit method
+# that adds each, its parameters, and whether it acts on two qubits (the control first)
+_GATES = {'x': (QuantumCircuit.x, (), False),
+          'y': (QuantumCircuit.y, (), False),
+          'z': (QuantumCircuit.z, (), False),
+          'h': (QuantumCircuit.h, (), False),
+          'ry(pi/4)': (QuantumCircuit.ry, (np.pi/4,), False),
+          'ry(-pi/4)': (QuantumCircuit.ry, (-np.pi/4,), False),
+          'rx(pi/4)': (QuantumCircuit.rx, (np.pi/4,), False),
+          'rx(-pi/4)': (QuantumCircuit.rx, (-np.pi/4,), False),
+          'cz': (QuantumCircuit.cz, (), True),
+          'cx': (QuantumCircuit.cx, (), True),
+          'swap': (QuantumCircuit.swap, (), True)}
+_GATE_NAMES = list(_GATES)
+_GATE_IDS = {name: gate for gate, name in enumerate(_GATE_NAMES)}
+
+# A compiled program: one row per gate, with control -1 for single qubit gates
+_PROGRAM = np.dtype([('gate', np.int8), ('target', np.int8), ('control', np.int8)])
+
+
+def _gate_matrix(name, target):
+    # The 4x4 matrix, in Qiskit's ordering, of gate `name` on `target` (controlled by the other qubit).
+    method, params, controlled = _GATES[name]
+    qubits = [1-target, target] if controlled else [target]
+    matrix = np.zeros((4, 4), dtype=complex)
+    for j in range(4):
+        psi = np.zeros((2, 2), dtype=complex)
+        psi.flat[j] = 1
+        apply_gate(psi, method.__name__, qubits, params)
+        matrix[:, j] = psi.reshape(4)
+    return matrix
+
+
+# _MATRICES[gate, target] is the matrix of a row of a program
+_MATRICES = np.array([[_gate_matrix(name, target) for target in range(2)] for name in _GATE_NAMES])
+
+
+def _compile(gate, target):
+    # The row of a program for gate `gate` (as named in _GATES) on qubit `target` (0 or 1).
+    return (_GATE_IDS[gate], target, 1-target if _GATES[gate][2] else -1)
+
+
+def _apply_program(qc, qr, program):
+    # Adds the gates of a compiled program to qc, on the qubits qr.
+    for gate, target, control in program.tolist():
+        method, params, controlled = _GATES[_GATE_NAMES[gate]]
+        if controlled:
+            method(qc, *params, qr[control], qr[target])
+        else:
+            method(qc, *params, qr[target])
+
+# Expectation values are rounded to multiples of this in the keys of _frames, so that
+# revisited states hit even when they differ in the last bits. Frames are drawn from the
+# exact values, and ones within a step look the same (the step is far below a pixel or
+# a shade of grey).
+_RHO_STEP = 1/1024
+
+# Encoded frames of pauli_grid.update_grid, by everything that is drawn (see _frame_key)
+_frames = _lru(256)
 
 class run_game():
     # Implements a puzzle, which is defined by the given inputs.
 
-    def __init__(self,initialize, success_condition, allowed_gates, vi, qubit_names, eps=0.1, backend=None, shots=1024,mode='circle',verbose=False):
+    def __init__(self,initialize, success_condition, allowed_gates, vi, qubit_names, eps=0.1, backend=None, shots=1024,mode='circle',verbose=False,frames=0):
         """
         initialize
             List of gates applied to the initial 00 state to get the starting state of the puzzle.
@@ -28,7 +94,7 @@ class run_game():
             Values for pauli observables that must be obtained for the puzzle to declare success.
         allowed_gates
             For each qubit, specify which operations are allowed in this puzzle. 'both' should be used only for operations that don't need a qubit to be specified ('cz' and 'unbloch').
-            Gates are expressed as a dict with an int as value. If this is non-zero, it specifies the number of times the gate is must be used (no more or less) for the puzzle to be successfully solved. If the value is zero, the player can use the gate any number of times.
+            Gates are expressed as a dict with an int as value. If this is non-zero, it specifies the number of times the gate must be used (at least) for the puzzle to be successfully solved. games.solver and games.replay use the same rule. If the value is zero, the player can use the gate any number of times.
         vi
             Some visualization information as a three element list. These specify:
             * which qubits are hidden (empty list if both shown).
@@ -47,6 +113,8 @@ class run_game():
         y_boxes = False
             Whether to show expectation values involving y.
         verbose=False
+        frames=0
+            If non-zero, each move is animated with this many frames (see pauli_grid.update_grid).
         """
         def get_total_gate_list():
             # Get a text block describing allowed gates.
@@ -85,7 +153,7 @@ class run_game():
             gates = get_total_gate_list
 
         def get_command(gate,qubit):
-            # For a given gate and qubit, return the string describing the corresoinding Qiskit string.
+            # For a given gate and qubit, return the row of a compiled program that applies it, and the Qiskit string describing it.
 
             if qubit=='both':
                 qubit = '1'
@@ -95,18 +163,14 @@ class run_game():
                     other_name = name
             # then make the command (both for the grid, and for printing to screen)
             if gate in ['x','y','z','h']:
-                real_command  = 'grid.qc.'+gate+'(grid.qr['+qubit+'])'
                 clean_command = 'qc.'+gate+'('+qubit_name+')'
             elif gate in ['ry(pi/4)','ry(-pi/4)']:
-                real_command  = 'grid.qc.ry('+'-'*(gate=='ry(-pi/4)')+'np.pi/4,grid.qr['+qubit+'])'
                 clean_command = 'qc.ry('+'-'*(gate=='ry(-pi/4)')+'np.pi/4,'+qubit_name+')'
             elif gate in ['rx(pi/4)','rx(-pi/4)']:
-                real_command  = 'grid.qc.rx('+'-'*(gate=='rx(-pi/4)')+'np.pi/4,grid.qr['+qubit+'])'
                 clean_command = 'qc.rx('+'-'*(gate=='rx(-pi/4)')+'np.pi/4,'+qubit_name+')'
             elif gate in ['cz','cx','swap']:
-                real_command  = 'grid.qc.'+gate+'(grid.qr['+'0'*(qubit=='1')+'1'*(qubit=='0')+'],grid.qr['+qubit+'])'
                 clean_command = 'qc.'+gate+'('+other_name+','+qubit_name+')'
-            return [real_command,clean_command]
+            return [_compile(gate,int(qubit)),clean_command]
 
         bloch = [None]
 
@@ -115,8 +179,7 @@ class run_game():
             grid = pauli_grid(backend=backend,shots=shots,mode='circle',y_boxes=True)
         else:
             grid = pauli_grid(backend=backend,shots=shots,mode=mode)
-        for gate in initialize:
-            eval( get_command(gate[0],gate[1])[0] )
+        grid.apply([get_command(gate[0],gate[1])[0] for gate in initialize])
 
         required_gates = copy.deepcopy(allowed_gates)
 
@@ -130,7 +193,7 @@ class run_game():
 
         # show figure
         grid_view = _img()
-        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list(),output=grid_view)
+        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list(),output=grid_view,frames=frames)
         display(grid_view.widget)
 
 
@@ -160,6 +223,8 @@ class run_game():
         boxes = widgets.VBox([gate,qubit,action])
         display(boxes)
         self.program = []
+        # the moves, compiled, for get_circuit
+        self._rows = []
 
         def given_gate(a):
             # Action to be taken when gate is chosen. This sets up the system to choose a qubit.
@@ -211,19 +276,19 @@ class run_game():
                                 bloch[0] = None
                         else:
                             command = get_command(q_gate,q01)
-                            eval(command[0])
+                            grid.apply([command[0]])
                             self.program.append( command[1] )
+                            self._rows.append( command[0] )
                         if required_gates[q01][gate.value]>0:
                             required_gates[q01][gate.value] -= 1
 
-                        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list(),output=grid_view)
+                        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list(),output=grid_view,frames=frames)
 
                 success = get_success(required_gates)
                 if success:
                     gate.options = ['Success!']
                     qubit.options = ['Success!']
                     action.options = ['Success!']
-                    plt.close(grid.fig)
                 else:
                     gate.value = description['gate'][0]
                     qubit.options = ['']
@@ -233,24 +298,39 @@ class run_game():
         qubit.observe(given_qubit)
         action.observe(given_action)
 
+    @classmethod
+    def from_puzzle(cls, puzzle, **kwargs):
+        """
+        Runs a puzzle given as a dict, as made by games.generator and read by games.solver
+        and games.replay: the arguments 'initialize', 'success_condition' and 'allowed_gates',
+        and optionally 'vi', 'qubit_names', 'eps' and 'mode'. Other keys are ignored, and
+        kwargs are passed on to run_game.
+        """
+        args = {'vi': [[], True, True], 'qubit_names': {'0': 'q[0]', '1': 'q[1]'}}
+        for key in ['initialize', 'success_condition', 'allowed_gates', 'vi', 'qubit_names', 'eps', 'mode']:
+            if key in puzzle:
+                args[key] = puzzle[key]
+        args.update(kwargs)
+        return cls(**args)
+
     def get_circuit(self):
 
         q = QuantumRegister(2,'q')
         b = ClassicalRegister(2,'b')
         qc = QuantumCircuit(q,b)
 
-        for line in self.program:
-            eval(line)
+        _apply_program(qc, q, np.array(self._rows, dtype=_PROGRAM))
 
         return qc
 
 class pauli_grid():
     # Allows a quantum circuit to be created, modified and implemented, and visualizes the output in the style of 'Hello Quantum'.
 
-    def __init__(self,backend=Aer.get_backend('aer_simulator'),shots=1024,mode='circle',y_boxes=False):
+    def __init__(self,backend='aer_simulator',shots=1024,mode='circle',y_boxes=False):
         """
-        backend=Aer.get_backend('aer_simulator')
-            Backend to be used by Qiskit to calculate expectation values (defaults to local simulator).
+        backend='aer_simulator'
+            Backend to be used by Qiskit to calculate expectation values, or the name of an Aer simulator (defaults to local simulator).
+            With None, they are calculated exactly instead.
         shots=1024
             Number of shots used to to calculate expectation values.
         mode='circle'
@@ -279,6 +359,28 @@ class pauli_grid():
         self.cr = ClassicalRegister(2)
         self.qc = QuantumCircuit(self.qr, self.cr)
 
+        # the statevector of self.qc as of its first _ket_length instructions, kept up to date by apply,
+        # and its stabilizer tableau while all the gates are Clifford gates (None after that)
+        self._ket = np.array([1,0,0,0], dtype=complex)
+        self._tableau = tableau(2)
+        self._ket_qc = self.qc
+        self._ket_length = 0
+
+        # the basis changes and measurements for each two-qubit basis, made once,
+        # to be appended to self.qc when expectation values are estimated with shots
+        self._measurements = {}
+        for basis in ['ZZ','ZX','XZ','XX','YY','YX','YZ','XY','ZY']:
+            measurement = QuantumCircuit(self.qr, self.cr)
+            for j in range(2):
+                if basis[j]=='X':
+                    measurement.h(self.qr[j])
+                elif basis[j]=='Y':
+                    measurement.sdg(self.qr[j])
+                    measurement.h(self.qr[j])
+            measurement.barrier(self.qr)
+            measurement.measure(self.qr,self.cr)
+            self._measurements[basis] = measurement
+
         self.mode = mode
         # colors are background, qubit circles and correlation circles, respectively
         if self.mode=='line':
@@ -291,9 +393,9 @@ class pauli_grid():
         else:
             figsize=(6,6)
      
-        self.fig = plt.figure(figsize=(6,6),facecolor=self.colors[0])
+        self.fig = _figure(figsize=(6,6),facecolor=self.colors[0])
         self.ax = self.fig.add_subplot(111)
-        plt.axis('off')
+        self.ax.axis('off')
 
         self.bottom = self.ax.text(-3,1,"",size=9,va='top',color='w')
 
@@ -302,7 +404,41 @@ class pauli_grid():
             self.points[pauli] = [ self.ax.add_patch( Circle(self.box[pauli], 0.0, color=(0,0,0), zorder=10) ) ]
             self.points[pauli].append( self.ax.add_patch( Circle(self.box[pauli], 0.0, color=(1,1,1), zorder=10) ) )
 
+        # the boxes, circles, bars and labels of the grid, made by the first call
+        # to update_grid and then only changed, so that the figure doesn't grow
+        self._boxes = {}
+        self._circles = {}
+        self._bars = {}
+        self._labels = {}
+        # held while the artists are changed, as transitions are rendered in a background thread
+        self._lock = threading.RLock()
+        self._display = None
+
 
+    def apply(self,program):
+        """
+        Adds the gates of a compiled program to self.qc.
+
+        program
+            Rows (gate, target, control) of _PROGRAM, as a structured array or a list of tuples,
+            with gate an index of _GATE_NAMES and control -1 for single qubit gates.
+        """
+        program = np.asarray(program, dtype=_PROGRAM).reshape(-1)
+        in_sync = self._ket_qc is self.qc and self._ket_length==len(self.qc.data)
+        _apply_program(self.qc, self.qr, program)
+        if in_sync:
+            # the exact state follows along, one 4x4 product per gate
+            for gate, target, control in program.tolist():
+                self._ket = _MATRICES[gate,target] @ self._ket
+                if self._tableau is not None:
+                    name = _GATES[_GATE_NAMES[gate]][0].__name__
+                    if name in tableau.GATES:
+                        self._tableau.apply(name, [control, target] if control>=0 else [target])
+                    else:
+                        self._tableau = None
+            self._ket_length = len(self.qc.data)
+
+    @timer('hello_quantum.get_rho')
     def get_rho(self):
         # Runs the circuit specified by self.qc and determines the expectation values for 'ZI', 'IZ', 'ZZ', 'XI', 'IX', 'XX', 'ZX' and 'XZ' (and the ones with Ys too if needed).
 
@@ -316,27 +452,29 @@ class pauli_grid():
             
         self.rho = {}
 
+        if self.backend==None:
+            if self._ket_qc is not self.qc or self._ket_length!=len(self.qc.data):
+                self._ket, self._tableau = statevector(self.qc), tableau.from_circuit(self.qc)
+                self._ket_qc, self._ket_length = self.qc, len(self.qc.data)
+            if self._tableau is not None:
+                # for Clifford circuits, the values (all 0 or ±1) are read off the tableau
+                values = self._tableau.expectations(_PAULI_NAMES)
+            else:
+                # exact values, from one contraction with the statevector for all the observables
+                values = np.einsum('i,kij,j->k', self._ket.conj(), _PAULI_OPERATORS, self._ket).real
+            for pauli, value in zip(_PAULI_NAMES, values):
+                if self.y_boxes or 'Y' not in pauli:
+                    self.rho[pauli] = float(value)
+            return
+
+        # the circuits for all bases go in one job, so that there is one round trip to the backend
+        circuits = [self.qc.compose(self._measurements[basis]) for basis in corr]
+        with timed('execute'):
+            result = execute(circuits, backend=self.backend, shots=self.shots).result()
         results = {}
-        for basis in corr:
-            temp_qc = copy.deepcopy(self.qc)
-            for j in range(2):
-                if basis[j]=='X':
-                    temp_qc.h(self.qr[j])
-                elif basis[j]=='Y':
-                    temp_qc.sdg(self.qr[j])
-                    temp_qc.h(self.qr[j])
-                
-            if self.backend==None:
-                ket = Statevector([1,0,0,0])
-                ket = ket.from_instruction(temp_qc)
-                results[basis] = ket.probabilities_dict()          
-            else:     
-                temp_qc.barrier(self.qr)
-                temp_qc.measure(self.qr,self.cr)
-                job = execute(temp_qc, backend=self.backend, shots=self.shots)
-                results[basis] = job.result().get_counts()
-                for string in results[basis]:
-                    results[basis][string] = results[basis][string]/self.shots
+        for j, basis in enumerate(corr):
+            counts = result.get_counts(j)
+            results[basis] = {string: counts[string]/self.shots for string in counts}
 
         prob = {}
         # prob of expectation value -1 for single qubit observables
@@ -367,7 +505,8 @@ class pauli_grid():
             
         
 
-    def update_grid(self,rho=None,labels=False,bloch=None,hidden=[],qubit=True,corr=True,message="",output=None):
+    @timer('hello_quantum.update_grid')
+    def update_grid(self,rho=None,labels=False,bloch=None,hidden=[],qubit=True,corr=True,message="",output=None,frames=0,fps=25):
         """
         rho = None
             Dictionary of expectation values for 'ZI', 'IZ', 'ZZ', 'XI', 'IX', 'XX', 'ZX' and 'XZ'. If supplied, this will be visualized instead of the results of running self.qc.
@@ -383,9 +522,14 @@ class pauli_grid():
             Whether the correlation circles (the four in the middle) are shown.
         message
             A string of text that is displayed below the grid.
+        output = None
+            The _img to show the grid in (it is displayed below the cell if None).
+        frames = 0
+            If non-zero, the change from the previous expectation values is animated in `output`,
+            with this many frames streamed at up to `fps` per second (see `_animate`).
         """
 
-        def see_if_unhidden(pauli):
+        def see_if_unhidden(pauli,state):
             # For a given Pauli, see whether its circle should be shown.
 
             unhidden = True
@@ -400,10 +544,10 @@ class pauli_grid():
             if corr==False:
                 unhidden = unhidden and ((pauli[0]=='I') or (pauli[1]=='I'))
             # finally: is it actually in rho
-            unhidden = unhidden and (pauli in self.rho)
+            unhidden = unhidden and (pauli in state)
             return unhidden
 
-        def add_line(line,pauli_pos,pauli):
+        def add_line(line,pauli_pos,pauli,state):
             """
             For mode='line', add in the line.
 
@@ -412,18 +556,24 @@ class pauli_grid():
             expect = the expectation value that determines its length
             """
 
-            unhidden = see_if_unhidden(pauli)
-            p = (1-self.rho[pauli])/2 # prob of 1 output
+            unhidden = see_if_unhidden(pauli,state)
+            p = (1-state[pauli])/2 # prob of 1 output
             # in the following, white lines goes from a to b, and black from b to c
             if unhidden:
+                if (line,pauli_pos) not in self._bars:
+                    angle = -45*(line not in ['X','Z'])
+                    self._bars[line,pauli_pos] = [ self.ax.add_patch( Rectangle( (0,0), 0, 0, angle=angle, color=(0.0,0.0,0.0)) ),
+                                                   self.ax.add_patch( Rectangle( (0,0), 0, 0, angle=angle, color=(1.0,1.0,1.0)) ) ]
+                black, white = self._bars[line,pauli_pos]
+
                 if line=='X':
                     
                     a = ( self.box[pauli_pos][0]-length/2, self.box[pauli_pos][1]-width/2 )
                     c = ( self.box[pauli_pos][0]+length/2, self.box[pauli_pos][1]-width/2 )
                     b = ( p*a[0] + (1-p)*c[0] , p*a[1] + (1-p)*c[1] )
                     
-                    self.ax.add_patch( Rectangle( a, length*(1-p), width, angle=0, color=(0.0,0.0,0.0)) )
-                    self.ax.add_patch( Rectangle( b, length*p, width, angle=0, color=(1.0,1.0,1.0)) )
+                    black.set_bounds( a[0], a[1], length*(1-p), width )
+                    white.set_bounds( b[0], b[1], length*p, width )
                     
                 elif line=='Z':
                     
@@ -431,8 +581,8 @@ class pauli_grid():
                     c = ( self.box[pauli_pos][0]-width/2, self.box[pauli_pos][1]+length/2 )
                     b = ( p*a[0] + (1-p)*c[0] , p*a[1] + (1-p)*c[1] )
                     
-                    self.ax.add_patch( Rectangle( a, width, length*(1-p), angle=0, color=(0.0,0.0,0.0)) )
-                    self.ax.add_patch( Rectangle( b, width, length*p, angle=0, color=(1.0,1.0,1.0)) )
+                    black.set_bounds( a[0], a[1], width, length*(1-p) )
+                    white.set_bounds( b[0], b[1], width, length*p )
                     
                 else:
                     
@@ -441,81 +591,183 @@ class pauli_grid():
                     c = ( self.box[pauli_pos][0]+length/(2*np.sqrt(2)), self.box[pauli_pos][1]+length/(2*np.sqrt(2)) )
                     b = ( p*a[0] + (1-p)*c[0] , p*a[1] + (1-p)*c[1] )
                     
-                    self.ax.add_patch( Rectangle( a, width, length*(1-p), angle=-45, color=(0.0,0.0,0.0)) )
-                    self.ax.add_patch( Rectangle( b, width, length*p, angle=-45, color=(1.0,1.0,1.0)) )
+                    black.set_bounds( a[0], a[1], width, length*(1-p) )
+                    white.set_bounds( b[0], b[1], width, length*p )
+
+                # bars go over those drawn before them in this update, as when each was a new patch
+                drawn.append(pauli_pos)
+                for patch in [black, white]:
+                    patch.set_zorder(1 + len(drawn)/100)
+                    patch.set_visible(True)
                 
             return p
 
+        def set_state(state):
+            # Sets the circles, bars and points to show the expectation values in `state`.
+
+            # bars are shown again below if they are needed
+            drawn[:] = []
+            for bar in self._bars.values():
+                for patch in bar:
+                    patch.set_visible(False)
+
+            # draw circles
+            for pauli in self.box:
+                unhidden = see_if_unhidden(pauli,state)
+                if unhidden:
+                    if self.mode=='line':
+                        self._circles[pauli].set_color((0.5,0.5,0.5))
+                    else:
+                        prob = (1-state[pauli])/2
+                        color=(prob,prob,prob) 
+                        self._circles[pauli].set_color(color)
+                self._circles[pauli].set_visible(unhidden)
+
+            # update bars if required
+            if self.mode=='line':
+                if bloch in ['0','1']:
+                    for other in 'IXZ':
+                        px = other*(bloch=='1') + 'X' + other*(bloch=='0')
+                        pz = other*(bloch=='1') + 'Z' + other*(bloch=='0')
+                        prob_z = add_line('Z',pz,pz,state)
+                        prob_x = add_line('X',pz,px,state)
+                        for j,point in enumerate(self.points[pz]):
+                            point.center = (self.box[pz][0]-(prob_x-0.5)*length, self.box[pz][1]-(prob_z-0.5)*length)
+                            point.radius = (j==0)*0.05 + (j==1)*0.04
+                    px = 'I'*(bloch=='0') + 'X' + 'I'*(bloch=='1')
+                    pz = 'I'*(bloch=='0') + 'Z' + 'I'*(bloch=='1')
+                    add_line('Z',pz,pz,state)
+                    add_line('X',px,px,state)
+                else:
+                    for pauli in self.box:
+                        for point in self.points[pauli]:
+                            point.radius = 0.0
+                        if pauli in ['ZI','IZ','ZZ']:
+                            add_line('Z',pauli,pauli,state)
+                        if pauli in ['XI','IX','XX']:
+                            add_line('X',pauli,pauli,state)
+                        if pauli in ['XZ','ZX']:
+                            add_line('ZX',pauli,pauli,state)
+
         L = 0.98*np.sqrt(2) # box height and width
         length = 0.75*L # line length
         width = 0.12*L # line width
         r = 0.6 # circle radius
+        drawn = [] # the boxes given bars so far in an update
 
         # set the state
+        previous = self.rho
         self.rho = rho
         if self.rho=={} or self.rho==None:
             self.get_rho()
 
-        # draw boxes
-        for pauli in self.box:
-            if 'I' in pauli:
-                color = self.colors[1]
-            else:
-                color = self.colors[2]
-            self.ax.add_patch( Rectangle( (self.box[pauli][0],self.box[pauli][1]-1), L, L, angle=45, color=color) )
+        if output is not None:
+            # a transition still being streamed to the output would overwrite this update
+            executor.cancel(output)
 
-        # draw circles
-        for pauli in self.box:
-            unhidden = see_if_unhidden(pauli)
-            if unhidden:
-                if self.mode=='line':
-                    self.ax.add_patch( Circle(self.box[pauli], r, color=(0.5,0.5,0.5)) )
-                else:
-                    prob = (1-self.rho[pauli])/2
-                    color=(prob,prob,prob) 
-                    self.ax.add_patch( Circle(self.box[pauli], r, color=color) )
+        state = dict(self.rho)
 
-        # update bars if required
-        if self.mode=='line':
-            if bloch in ['0','1']:
-                for other in 'IXZ':
-                    px = other*(bloch=='1') + 'X' + other*(bloch=='0')
-                    pz = other*(bloch=='1') + 'Z' + other*(bloch=='0')
-                    prob_z = add_line('Z',pz,pz)
-                    prob_x = add_line('X',pz,px)
-                    for j,point in enumerate(self.points[pz]):
-                        point.center = (self.box[pz][0]-(prob_x-0.5)*length, self.box[pz][1]-(prob_z-0.5)*length)
-                        point.radius = (j==0)*0.05 + (j==1)*0.04
-                px = 'I'*(bloch=='0') + 'X' + 'I'*(bloch=='1')
-                pz = 'I'*(bloch=='0') + 'Z' + 'I'*(bloch=='1')
-                add_line('Z',pz,pz)
-                add_line('X',px,px)
-            else:
+        # states are revisited often in a puzzle, and then shown without drawing
+        key = None
+        if output is not None and not frames:
+            steps = {pauli: int(round(value/_RHO_STEP)) for pauli, value in state.items()}
+            key = self._frame_key(steps,labels,bloch,hidden,qubit,corr,message,output)
+            data = _frames.get(key)
+            if data is not None:
+                output.data = data
+                return
+
+        with self._lock:
+
+            # draw boxes, and make the circles to go on them
+            if not self._boxes:
                 for pauli in self.box:
-                    for point in self.points[pauli]:
-                        point.radius = 0.0
-                    if pauli in ['ZI','IZ','ZZ']:
-                        add_line('Z',pauli,pauli)
-                    if pauli in ['XI','IX','XX']:
-                        add_line('X',pauli,pauli)
-                    if pauli in ['XZ','ZX']:
-                        add_line('ZX',pauli,pauli)
-
-        self.bottom.set_text(message)
-
-        if labels:
-            for pauli in self.box:
-                plt.text(self.box[pauli][0]-0.18,self.box[pauli][1]-0.85, pauli)
+                    if 'I' in pauli:
+                        color = self.colors[1]
+                    else:
+                        color = self.colors[2]
+                    self._boxes[pauli] = self.ax.add_patch( Rectangle( (self.box[pauli][0],self.box[pauli][1]-1), L, L, angle=45, color=color) )
+                for pauli in self.box:
+                    self._circles[pauli] = self.ax.add_patch( Circle(self.box[pauli], r, visible=False) )
 
-        if self.y_boxes:
-            self.ax.set_xlim([-4,4])
-            self.ax.set_ylim([0,8])
-        else:
-            self.ax.set_xlim([-3,3])
-            self.ax.set_ylim([0,6])
+            set_state(state)
 
-        if output is None:
-            self.fig.canvas.draw()
-        else:
-            plt.close() # prevent the graphic from showing inline
-            output.value = self.fig
+            self.bottom.set_text(message)
+
+            if labels and not self._labels:
+                for pauli in self.box:
+                    self._labels[pauli] = self.ax.text(self.box[pauli][0]-0.18,self.box[pauli][1]-0.85, pauli)
+            for label in self._labels.values():
+                label.set_visible(labels)
+
+            if self.y_boxes:
+                self.ax.set_xlim([-4,4])
+                self.ax.set_ylim([0,8])
+            else:
+                self.ax.set_xlim([-3,3])
+                self.ax.set_ylim([0,6])
+
+            if frames and output is not None:
+                self._animate(previous, state, set_state, frames, fps, output)
+            elif output is None:
+                # the figure isn't known to pyplot, so it is displayed by the first update,
+                # and that display is updated in place after that
+                if self._display is None:
+                    self._display = display(self.fig, display_id=True)
+                else:
+                    self._display.update(self.fig)
+            else:
+                output.value = self.fig
+                _frames.put(key, bytes(output.data))
+
+    def _frame_key(self,steps,labels,bloch,hidden,qubit,corr,message,output):
+        # Everything that determines the frame encoded by update_grid.
+        return (tuple(sorted(steps.items())), self.mode, self.y_boxes, tuple(hidden), qubit, corr, bloch, labels,
+                blake2b(message.encode(), digest_size=16).digest(),
+                output.format, output.dpi, output.compress_level, output.quality)
+
+    def _animate(self, start, end, set_state, frames, fps, output):
+        """
+        Streams the change from the expectation values `start` to `end`
+        to `output`, an _img, with the values interpolated over `frames` frames.
+
+        The figure is drawn in full once, without the circles, bars, points and text,
+        to give a background. Each frame then only restores the background and draws
+        those artists over it, in the background thread of `executor.stream`, which
+        drops frames when it falls behind `fps`. The last frame is always shown.
+        """
+        states = []
+        for j in range(1, frames+1):
+            t = j/frames
+            states.append({pauli: (1-t)*start.get(pauli, end[pauli]) + t*end[pauli] for pauli in end})
+
+        canvas = self.fig.canvas
+        artists = list(self._circles.values()) + [patch for bar in self._bars.values() for patch in bar]
+        artists += [point for points in self.points.values() for point in points]
+        artists += list(self._labels.values()) + [self.bottom]
+        # in the order that a full draw would use
+        artists = sorted([artist for artist in self.ax.get_children() if artist in artists],
+                         key=lambda artist: artist.get_zorder())
+
+        # only the artists shown at the end are shown during the transition
+        shown = [artist for artist in artists if artist.get_visible()]
+        for artist in shown:
+            artist.set_visible(False)
+        canvas.draw()
+        background = canvas.copy_from_bbox(self.fig.bbox)
+        for artist in shown:
+            artist.set_visible(True)
+
+        def render(state):
+            with self._lock:
+                set_state(state)
+                canvas.restore_region(background)
+                for artist in sorted(shown, key=lambda artist: artist.get_zorder()):
+                    self.ax.draw_artist(artist)
+                rgba = np.asarray(canvas.buffer_rgba()).copy()
+            return output.encode(rgba)
+
+        def show(data):
+            output.data = data
+
+        executor.stream(output, render, states, show, fps=fps)
@@ -4,6 +4,8 @@ from ipywidgets import widgets
 from ipywidgets import Layout, HBox, VBox
 from IPython.display import display
 
+from qiskit_textbook.widgets._helpers import _transaction
+
 class Pixel():
     
     def __init__(self, layout):
@@ -118,7 +120,9 @@ class QiskitGameEngine():
 
         for button in self.controller:
             if self.controller[button].value is True:
-                self.next_frame(self)
+                # a frame often repaints pixels it leaves unchanged: send only what changed
+                with _transaction(*[pixel._button for pixel in self.screen.pixel.values()]):
+                    self.next_frame(self)
 
         for button in self.controller.values():
             button.value = False
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Replays the moves recorded in run_game.program, without widgets or figures, to
+grade or analyse many sessions at once.
+
+Each distinct line of a program ('qc.h(q[0])', 'qc.cz(A,B)', ...) is parsed once,
+into a row of a compiled program (as for pauli_grid.apply). All the programs are
+then run together: the statevectors of the sessions are stacked, and each step is
+one batched product with the 4x4 matrices of their next gates.
+
+    python -m qiskit_textbook.games.replay sessions.jsonl --puzzles puzzles.json --output grades.jsonl
+
+Each line of the sessions file has a 'program' (the list of strings) and a 'puzzle'
+(its index in the JSON list of puzzles, as given to run_game), and optionally an 'id'.
+Sessions whose puzzle isn't in the list are written with an 'error' instead of a grade.
+"""
+import argparse
+import json
+import re
+import sys
+
+import numpy as np
+
+from qiskit_textbook.games.hello_quantum import _PAULI_NAMES, _PROGRAM, _MATRICES, _compile
+from qiskit_textbook.games.solver import _moves, _initial_state, _expectations, _TRANSLATIONS, _VIEWS
+from qiskit_textbook.widgets._helpers import _lru
+
+# the matrix of each (gate, target) row of a program, at gate*2 + target, then the identity
+_TABLE = np.concatenate([_MATRICES.reshape(-1, 4, 4), np.eye(4, dtype=complex)[None]])
+_IDENTITY = len(_TABLE) - 1
+
+# qc.<gate>(<angle>,<qubit>) or qc.<gate>(<qubit>) or qc.<gate>(<control>,<qubit>), as from run_game
+_LINE = re.compile(r"qc\.(\w+)\((-?np\.pi/4,)?([^,()]+)(?:,([^,()]+))?\)$")
+
+# (line, qubit names) -> row of a compiled program
+_parsed = _lru(4096)
+
+
+def _parse(line, qubit_names):
+    key = (line, qubit_names)
+    row = _parsed.get(key)
+    if row is None:
+        match = _LINE.match(line.replace(' ', ''))
+        if match is None:
+            raise ValueError("Can't replay '%s'" % line)
+        gate, angle, first, second = match.groups()
+        if angle is not None:
+            gate += '(' + angle[:-1].replace('np.', '') + ')'
+        qubits = dict((name, int(q)) for q, name in qubit_names)
+        row = _compile(gate, qubits[second if second is not None else first])
+        _parsed.put(key, row)
+    return row
+
+
+def compile_program(program, qubit_names={'0': 'q[0]', '1': 'q[1]'}):
+    """
+    Compiles the strings of run_game.program.
+
+        program (list): Lines such as 'qc.ry(np.pi/4,q[0])'.
+        qubit_names (dict): The names of qubits '0' and '1' in the puzzle.
+
+        Returns:
+            ndarray: The program as rows of hello_quantum._PROGRAM.
+    """
+    names = tuple(sorted(qubit_names.items()))
+    return np.array([_parse(line, names) for line in program], dtype=_PROGRAM).reshape(-1)
+
+
+def final_states(programs, qubit_names={'0': 'q[0]', '1': 'q[1]'}, initial_state=None):
+    """
+    Runs many programs together.
+
+        programs (list): Programs, each a list of strings as in run_game.program,
+                         or an array compiled by `compile_program`.
+        qubit_names (dict): The names of qubits '0' and '1' in the puzzle.
+        initial_state (ndarray): The state all programs start from (|00⟩ if None).
+
+        Returns:
+            ndarray: The final statevector of each program, one per row.
+    """
+    return _run(programs, qubit_names, initial_state)[0]
+
+
+def _run(programs, qubit_names, initial_state):
+    # The final states, and the rows of the programs as indices in _TABLE.
+    compiled = [program if isinstance(program, np.ndarray) else compile_program(program, qubit_names)
+                for program in programs]
+    lengths = np.array([len(program) for program in compiled], dtype=np.int64)
+    ids = np.full((len(compiled), lengths.max(initial=0)), _IDENTITY)
+    if len(compiled):
+        rows = np.concatenate([np.zeros(0, dtype=_PROGRAM)] + compiled)
+        ids[np.arange(ids.shape[1]) < lengths[:, None]] = 2*rows['gate'].astype(np.int64) + rows['target']
+
+    if initial_state is None:
+        initial_state = [1, 0, 0, 0]
+    states = np.tile(np.asarray(initial_state, dtype=complex), (len(compiled), 1))
+    for step in range(ids.shape[1]):
+        running = lengths > step
+        states[running] = np.einsum('nij,nj->ni', _TABLE[ids[running, step]], states[running])
+    return states, ids
+
+
+def grade(programs, puzzle):
+    """
+    Grades recorded programs for one puzzle as run_game would: the expectation values
+    must be within eps of success_condition, and each gate given a count in
+    allowed_gates used at least that many times (the rule games.solver uses too).
+    Counts for 'bloch' and 'unbloch', which aren't recorded in programs, aren't checked.
+
+        programs (list): Programs for the puzzle, as in run_game.program.
+        puzzle (dict): 'initialize', 'success_condition' and 'allowed_gates' as
+                       for run_game, and optionally 'qubit_names' and 'eps' (0.1 if not given).
+
+        Returns:
+            list: A dict for each program, with 'success' (bool), 'condition' and
+                  'gates' (whether each requirement is met), 'moves' and 'rho'.
+    """
+    qubit_names = puzzle.get('qubit_names', {'0': 'q[0]', '1': 'q[1]'})
+    states, ids = _run(programs, qubit_names, _initial_state(puzzle['initialize']))
+    rho = _expectations(states)
+
+    condition = np.ones(len(states), dtype=bool)
+    for pauli, value in puzzle['success_condition'].items():
+        condition &= np.abs(rho[:, _PAULI_NAMES.index(pauli)] - value) < puzzle.get('eps', 0.1)
+
+    # the uses of each counted gate, from the ids of the rows of the programs
+    moves, counters, counter_of = _moves(puzzle['allowed_gates'])
+    counter_index = np.full(len(_TABLE), -1)
+    for (gate, q), counter in zip(moves, counter_of):
+        if counter >= 0 and gate not in _VIEWS:
+            gate_id, target, _ = _compile(_TRANSLATIONS.get(gate, gate), 1 if q == 'both' else int(q))
+            counter_index[2*gate_id + target] = counter
+    required = np.array([puzzle['allowed_gates'][q][gate] if gate not in _VIEWS else 0
+                         for q, gate in counters], dtype=np.int64)
+    uses = np.zeros((len(states), len(counters)), dtype=np.int64)
+    program_of, step = np.nonzero(counter_index[ids] >= 0)
+    np.add.at(uses, (program_of, counter_index[ids[program_of, step]]), 1)
+    gates = (uses >= required).all(axis=1)
+
+    lengths = (ids != _IDENTITY).sum(axis=1)
+    return [{'success': bool(c and g), 'condition': bool(c), 'gates': bool(g), 'moves': int(n),
+             'rho': dict(zip(_PAULI_NAMES, values.tolist()))}
+            for c, g, n, values in zip(condition, gates, lengths, rho)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('sessions', help='JSON Lines file of sessions')
+    parser.add_argument('--puzzles', required=True, help='JSON file with the list of puzzles')
+    parser.add_argument('--output', help='JSON Lines file for the grades (default: stdout)')
+    args = parser.parse_args(argv)
+
+    with open(args.puzzles) as file:
+        puzzles = json.load(file)
+    with open(args.sessions) as file:
+        sessions = [json.loads(line) for line in file if line.strip()]
+
+    # the sessions of each puzzle are replayed together
+    by_puzzle = {}
+    for j, session in enumerate(sessions):
+        by_puzzle.setdefault(session['puzzle'], []).append(j)
+    grades = [None]*len(sessions)
+    for p, indices in by_puzzle.items():
+        if not isinstance(p, int) or not 0 <= p < len(puzzles):
+            continue
+        for j, result in zip(indices, grade([sessions[j]['program'] for j in indices], puzzles[p])):
+            grades[j] = result
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for j, (session, result) in enumerate(zip(sessions, grades)):
+            if result is None:
+                result = {'error': 'no puzzle %r' % (session['puzzle'],)}
+            output.write(json.dumps(dict(id=session.get('id', j), **result)) + '\n')
+    finally:
+        if args.output:
+            output.close()
+    graded = [result for result in grades if result is not None]
+    print("%i of %i solved" % (sum(result['success'] for result in graded), len(graded)), file=sys.stderr)
+    if len(graded) < len(grades):
+        print("%i sessions not graded, as their puzzle isn't in %s" % (len(grades) - len(graded), args.puzzles),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Checks that hello_quantum puzzles can be solved, and finds their shortest solutions.
+
+The states reachable from a puzzle's `initialize` with its `allowed_gates` are
+found breadth first, up to `max_moves` moves. Statevectors are canonicalized
+(global phase removed, then rounded), so that each state is simulated, and has
+its expectation values computed, once. Gates given a non-zero count in
+allowed_gates must be used at least that many times, as in run_game (and
+games.replay), so each node of the graph is a state together with the uses
+still required of those gates.
+
+    python -m qiskit_textbook.games.solver puzzles.json --max-moves 10 --cache-dir .puzzle-cache
+
+The input is a JSON list of puzzles, as given to run_game: dicts with
+'initialize', 'success_condition' and 'allowed_gates' (and optionally 'eps').
+Graphs saved in --cache-dir are loaded instead of being searched again.
+"""
+import argparse
+import json
+import os
+import sys
+from hashlib import blake2b
+
+import numpy as np
+
+from qiskit_textbook.games.hello_quantum import _PAULI_NAMES, _PAULI_OPERATORS, _MATRICES, _compile
+from qiskit_textbook.widgets._helpers import _lru
+
+# changed whenever saved graphs would no longer be valid
+_VERSION = 2
+
+# the names run_game shows for some gates in bit puzzles
+_TRANSLATIONS = {'NOT': 'x', 'CNOT': 'cx'}
+
+# moves that only change how the grid is shown
+_VIEWS = ['bloch', 'unbloch']
+
+# graphs already built or loaded in this session, by _graph_key
+_graphs = _lru(32)
+
+
+def _moves(allowed_gates):
+    """
+    The moves of a puzzle, as run_game offers them: [gate, qubit] pairs, with qubit
+    '0', '1' or 'both' (for gates in allowed_gates['both'], applied with qubit 1 as target).
+
+        Returns:
+            (list, list, list): The moves, the [qubit, gate] pairs that must be used at least
+                                a given number of times, and the index in that list for each move
+                                (-1 for moves that can be used freely).
+    """
+    gates = []
+    for q in ['0', '1', 'both']:
+        for gate in allowed_gates.get(q, {}):
+            if gate not in gates:
+                gates.append(gate)
+    moves, counters, counter_of = [], [], []
+    for gate in gates:
+        if gate in allowed_gates.get('both', {}):
+            qubits = ['both']
+        else:
+            qubits = [q for q in ['0', '1'] if gate in allowed_gates.get(q, {})]
+        for q in qubits:
+            moves.append([gate, q])
+            if allowed_gates[q][gate] > 0:
+                counter_of.append(len(counters))
+                counters.append([q, gate])
+            else:
+                counter_of.append(-1)
+    return moves, counters, counter_of
+
+
+def _matrix(gate, qubit):
+    # The 4x4 matrix of a move, or of a step of `initialize`.
+    if gate in _VIEWS:
+        return np.eye(4, dtype=complex)
+    gate_id, target, _ = _compile(_TRANSLATIONS.get(gate, gate), 1 if qubit == 'both' else int(qubit))
+    return _MATRICES[gate_id, target]
+
+
+def _initial_state(initialize):
+    psi = np.array([1, 0, 0, 0], dtype=complex)
+    for gate, qubit in initialize:
+        psi = _matrix(gate, qubit) @ psi
+    return psi
+
+
+def _canonical(states):
+    """
+    Removes the global phase from each row of `states` (the first amplitude not close
+    to zero is made real and positive).
+
+        Returns:
+            (ndarray, list): The states, and a hashable key for each.
+    """
+    states = np.asarray(states, dtype=complex).reshape(-1, 4)
+    first = np.argmax(np.abs(states) > 1e-6, axis=1)
+    phase = states[np.arange(len(states)), first]
+    states = states * (np.abs(phase)/phase)[:, None]
+    keys = np.round(states.view(float)*1e6).astype(np.int64)
+    return states, [key.tobytes() for key in keys]
+
+
+def _expectations(states):
+    # The expectation values of _PAULI_NAMES, for each row of `states`.
+    return np.einsum('si,kij,sj->sk', states.conj(), _PAULI_OPERATORS, states).real
+
+
+class puzzle_graph():
+    """
+    The states reachable in a puzzle, and the moves between them. Built by `reachable`.
+
+        moves (list): The [gate, qubit] moves of the puzzle.
+        counters (list): The [qubit, gate] pairs that must be used at least a given number of times.
+        states (ndarray): The distinct (canonical) statevectors.
+        rho (ndarray): The expectation values of _PAULI_NAMES, for each state.
+        node_state (ndarray): The state of each node. Node 0 is the start of the puzzle.
+        node_counts (ndarray): The uses still required of each counter, for each node.
+        depth (ndarray): The fewest moves that reach each node.
+        edges (ndarray): The moves found, as rows (node, next node, index in moves).
+        max_moves (int): The depth the search went to.
+        exhaustive (bool): Whether every reachable node was found within that depth.
+    """
+
+    def __init__(self, moves, counters, states, rho, node_state, node_counts, depth, edges,
+                 max_moves, exhaustive):
+        self.moves = moves
+        self.counters = counters
+        self.states = states
+        self.rho = rho
+        self.node_state = node_state
+        self.node_counts = node_counts
+        self.depth = depth
+        self.edges = edges
+        self.max_moves = max_moves
+        self.exhaustive = exhaustive
+
+    def goals(self, success_condition, eps=0.1):
+        """Whether each node solves the puzzle: all required gates used, and the
+        expectation values within eps of success_condition."""
+        solved = (self.node_counts == 0).all(axis=1)
+        rho = self.rho[self.node_state]
+        for pauli, value in success_condition.items():
+            solved &= np.abs(rho[:, _PAULI_NAMES.index(pauli)] - value) < eps
+        return solved
+
+    def distances(self, success_condition, eps=0.1):
+        """The fewest moves from each node to a solution (-1 where none is known)."""
+        distance = np.full(len(self.node_state), -1)
+        distance[self.goals(success_condition, eps)] = 0
+        src, dst = self.edges[:, 0], self.edges[:, 1]
+        d = 0
+        while True:
+            reached = (distance[dst] == d) & (distance[src] == -1)
+            if not reached.any():
+                return distance
+            d += 1
+            distance[src[reached]] = d
+
+    def node(self, program):
+        """The node reached by a list of [gate, qubit] moves, or None if it isn't in the graph."""
+        node = 0
+        for move in program:
+            index = self.moves.index(list(move))
+            options = self.edges[(self.edges[:, 0] == node) & (self.edges[:, 2] == index)]
+            if not len(options):
+                return None
+            node = options[0, 1]
+        return int(node)
+
+    def hint(self, program, success_condition, eps=0.1):
+        """The moves that start a shortest solution after the moves in `program`."""
+        node = self.node(program)
+        if node is None:
+            return []
+        distance = self.distances(success_condition, eps)
+        if distance[node] <= 0:
+            return []
+        edges = self.edges[(self.edges[:, 0] == node) & (distance[self.edges[:, 1]] == distance[node] - 1)]
+        return [self.moves[move] for move in sorted(set(edges[:, 2].tolist()))]
+
+    def solutions(self, success_condition, eps=0.1, max_solutions=10):
+        """
+        The shortest solutions of the puzzle.
+
+            Returns:
+                (int, list): Their number of moves (None if there are none within the graph),
+                             and up to max_solutions of them, as lists of [gate, qubit] moves.
+        """
+        distance = self.distances(success_condition, eps)
+        if distance[0] < 0:
+            return None, []
+        # edges that bring a solution one move closer
+        closer = self.edges[distance[self.edges[:, 1]] == distance[self.edges[:, 0]] - 1]
+        solutions = []
+        paths = [(0, [])]
+        while paths and len(solutions) < max_solutions:
+            node, path = paths.pop()
+            if distance[node] == 0:
+                solutions.append(path)
+                continue
+            for _, next_node, move in closer[closer[:, 0] == node][::-1].tolist():
+                paths.append((next_node, path + [self.moves[move]]))
+        return int(distance[0]), solutions
+
+    def save(self, path):
+        meta = {'moves': self.moves, 'counters': self.counters, 'max_moves': self.max_moves,
+                'exhaustive': self.exhaustive}
+        np.savez_compressed(path, states=self.states, rho=self.rho, node_state=self.node_state,
+                            node_counts=self.node_counts, depth=self.depth, edges=self.edges,
+                            meta=json.dumps(meta))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            return cls(meta['moves'], meta['counters'], data['states'], data['rho'], data['node_state'],
+                       data['node_counts'], data['depth'], data['edges'], meta['max_moves'],
+                       meta['exhaustive'])
+
+
+def _search(initialize, allowed_gates, max_moves, max_nodes):
+    moves, counters, counter_of = _moves(allowed_gates)
+    matrices = np.array([_matrix(gate, q) for gate, q in moves]).reshape(-1, 4, 4)
+
+    states, keys = _canonical(_initial_state(initialize))
+    states = [states[0]]
+    state_ids = {keys[0]: 0}
+    counts = np.array([allowed_gates[q][gate] for q, gate in counters], dtype=np.int64)
+    node_ids = {(0, counts.tobytes()): 0}
+    node_state, node_counts, depth = [0], [counts], [0]
+    edges = []
+
+    frontier = [0]
+    level = 0
+    while frontier and level < max_moves and len(node_state) <= max_nodes:
+        level += 1
+        nodes = np.array(frontier)
+        frontier_states = np.array(states)[np.array(node_state)[nodes]]
+        frontier_counts = np.array(node_counts, dtype=np.int64).reshape(len(node_counts), len(counters))[nodes]
+        frontier = []
+        for move, counter in enumerate(counter_of):
+            new_states, new_keys = _canonical(frontier_states @ matrices[move].T)
+            new_counts = frontier_counts.copy()
+            if counter >= 0:
+                # uses beyond the count are allowed, and leave it at 0
+                new_counts[:, counter] = np.maximum(new_counts[:, counter] - 1, 0)
+            for node, new_state, key, count in zip(nodes.tolist(), new_states, new_keys, new_counts):
+                state = state_ids.get(key)
+                if state is None:
+                    state = state_ids[key] = len(states)
+                    states.append(new_state)
+                next_node = node_ids.get((state, count.tobytes()))
+                if next_node is None:
+                    next_node = node_ids[state, count.tobytes()] = len(node_state)
+                    node_state.append(state)
+                    node_counts.append(count)
+                    depth.append(level)
+                    frontier.append(next_node)
+                edges.append((node, next_node, move))
+
+    states = np.array(states)
+    return (moves, counters, states, _expectations(states), np.array(node_state),
+            np.array(node_counts, dtype=np.int64).reshape(len(node_counts), len(counters)), np.array(depth),
+            np.array(edges, dtype=np.int64).reshape(-1, 3), level, not frontier)
+
+
+def _graph_key(initialize, allowed_gates, max_moves, max_nodes):
+    description = json.dumps([_VERSION, initialize, allowed_gates, max_moves, max_nodes], sort_keys=True)
+    return blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def reachable(initialize, allowed_gates, max_moves=10, max_nodes=200000, cache_dir=None):
+    """
+    Returns the puzzle_graph of the states reachable in a puzzle.
+
+        initialize (list): [gate, qubit] steps that give the starting state, as for run_game.
+        allowed_gates (dict): The gates allowed, and their required counts, as for run_game.
+        max_moves (int): How many moves deep to search.
+        max_nodes (int): The search stops after the first depth at which it has found
+                         more nodes than this.
+        cache_dir (str): Directory where graphs are saved, and loaded from if there.
+    """
+    key = _graph_key(initialize, allowed_gates, max_moves, max_nodes)
+    graph = _graphs.get(key)
+    if graph is not None:
+        return graph
+    path = None if cache_dir is None else os.path.join(cache_dir, 'puzzle-graph-%s.npz' % key)
+    if path is not None and os.path.exists(path):
+        graph = puzzle_graph.load(path)
+    else:
+        graph = puzzle_graph(*_search(initialize, allowed_gates, max_moves, max_nodes))
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            graph.save(path)
+    _graphs.put(key, graph)
+    return graph
+
+
+def solve(puzzle, max_moves=10, max_nodes=200000, max_solutions=10, cache_dir=None):
+    """
+    Finds the shortest solutions of a puzzle.
+
+        puzzle (dict): 'initialize', 'success_condition' and 'allowed_gates' as for
+                       run_game, and optionally 'eps' (0.1 if not given).
+
+        Returns:
+            dict: 'solvable' (True, False, or None if no solution was found but the search
+                  stopped before exhausting the reachable states), 'moves' (the length of the
+                  shortest solutions), 'solutions', and the size of the graph ('states', 'nodes').
+    """
+    graph = reachable(puzzle['initialize'], puzzle['allowed_gates'], max_moves, max_nodes, cache_dir)
+    moves, solutions = graph.solutions(puzzle['success_condition'], puzzle.get('eps', 0.1), max_solutions)
+    if moves is not None:
+        solvable = True
+    else:
+        solvable = False if graph.exhaustive else None
+    return {'solvable': solvable, 'moves': moves, 'solutions': solutions,
+            'states': len(graph.states), 'nodes': len(graph.node_state)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('puzzles', help='JSON file with a list of puzzles')
+    parser.add_argument('--max-moves', type=int, default=10, help='how many moves deep to search (default: 10)')
+    parser.add_argument('--max-nodes', type=int, default=200000, help='stop searching beyond this many nodes')
+    parser.add_argument('--max-solutions', type=int, default=3, help='shortest solutions to list per puzzle')
+    parser.add_argument('--cache-dir', help='directory to save searched graphs in, and load them from')
+    parser.add_argument('--output', help='JSON Lines file for the results (default: stdout)')
+    args = parser.parse_args(argv)
+
+    with open(args.puzzles) as file:
+        puzzles = json.load(file)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for j, puzzle in enumerate(puzzles):
+            result = solve(puzzle, args.max_moves, args.max_nodes, args.max_solutions, args.cache_dir)
+            output.write(json.dumps(dict(puzzle=j, **result)) + '\n')
+            if result['solvable'] is not True:
+                print("puzzle %i: %s" % (j, "unsolvable" if result['solvable'] is False else
+                                         "no solution within %i moves" % args.max_moves), file=sys.stderr)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Opt-in timers and counters for the hot paths of qiskit_textbook.
+
+Off by default, in which case every hook returns straight away. Turn it on
+with `enable()`, or before the package is imported by setting the
+environment variable QISKIT_TEXTBOOK_INSTRUMENT to 1 (or to the path of a
+.csv or .jsonl file, to also append a trace of every timed call to it).
+
+    from qiskit_textbook import instrumentation
+    instrumentation.enable(trace='trace.jsonl')
+    ...  # use the widgets and games
+    instrumentation.snapshot()
+    {'hello_quantum.get_rho': {'count': 12, 'total_ms': 310.4, 'mean_ms': 25.9, 'max_ms': 61.0}, ...}
+
+Names recorded:
+    execute                    Qiskit jobs run by the games.
+    hello_quantum.get_rho      Estimating the expectation values for a puzzle grid.
+    hello_quantum.update_grid  Redrawing a puzzle grid.
+    tools.num_to_latex         Formatting one amplitude as LaTeX.
+    tools.num_to_unicode       Formatting one amplitude as Unicode text.
+    widgets.simulate           Simulating a circuit for a widget.
+    widgets.format             Formatting a widget's state as text or LaTeX.
+    widgets.draw               Drawing a widget's figure (qc.draw, Bloch spheres, ...).
+    widgets.encode             Encoding a widget's figure as an image (_img).
+"""
+import atexit
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+ENV_VAR = 'QISKIT_TEXTBOOK_INSTRUMENT'
+
+# Read by the hooks before doing any work; use enable() and disable() to change it.
+enabled = False
+
+_lock = threading.Lock()
+_stats = {}  # name -> [count, total seconds, max seconds]
+_trace = None
+
+
+class _trace_writer():
+    """Appends one row (time, name, seconds, thread) per timed call to a CSV
+    or JSON Lines file, chosen by the file extension."""
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = not path.endswith('.csv')
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='')
+        if not self.jsonl:
+            self.writer = csv.writer(self.file)
+            if new:
+                self.writer.writerow(['time', 'name', 'seconds', 'thread'])
+
+    def write(self, name, seconds):
+        row = [time.time(), name, seconds, threading.current_thread().name]
+        if self.jsonl:
+            self.file.write(json.dumps(dict(zip(['time', 'name', 'seconds', 'thread'], row))) + '\n')
+        else:
+            self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+def enable(trace=None):
+    """
+    Starts recording. If `trace` is the path of a .csv or .jsonl file, every
+    timed call is also appended to it.
+    """
+    global enabled, _trace
+    with _lock:
+        if _trace is not None:
+            _trace.close()
+        _trace = _trace_writer(trace) if trace else None
+        enabled = True
+
+
+def disable():
+    """Stops recording, and closes the trace file. The counters are kept."""
+    global enabled, _trace
+    with _lock:
+        enabled = False
+        if _trace is not None:
+            _trace.close()
+            _trace = None
+
+
+def reset():
+    """Clears the counters."""
+    with _lock:
+        _stats.clear()
+
+
+def record(name, seconds):
+    """Adds one call of `name` that took `seconds`."""
+    if not enabled:
+        return
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            _stats[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        if _trace is not None:
+            _trace.write(name, seconds)
+
+
+@contextmanager
+def timed(name):
+    """Records the time spent in the `with` block under `name`."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timer(name):
+    """Decorator that records each call of the function under `name`."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Returns the counters recorded so far.
+
+        Returns:
+            dict: name -> {'count', 'total_ms', 'mean_ms', 'max_ms'}
+    """
+    with _lock:
+        return {name: {'count': count,
+                       'total_ms': 1000*total,
+                       'mean_ms': 1000*total/count,
+                       'max_ms': 1000*longest}
+                for name, (count, total, longest) in _stats.items()}
+
+
+def _from_environment():
+    value = os.environ.get(ENV_VAR, '').strip()
+    if value.lower() in ('', '0', 'false', 'no', 'off'):
+        return
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        enable()
+    else:
+        enable(trace=value)
+
+
+_from_environment()
+atexit.register(disable)
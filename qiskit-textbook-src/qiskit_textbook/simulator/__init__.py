@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+A small statevector simulator for the few-qubit circuits of the widgets and games.
+
+Running these circuits on a backend costs far more in transpilation, job and result
+handling than in the simulation itself. Here the state is kept as an array of
+shape (2,)*n, and each gate updates it in place: single-qubit gates through the two
+halves of the qubit's axis, controlled gates on the view where their controls are 1,
+and anything else through a tensor contraction with the gate's matrix.
+
+    from qiskit_textbook.simulator import statevector
+    statevector(qc)  # the same as Statevector(qc).data, in Qiskit's qubit ordering
+
+Clifford circuits can instead be followed with a stabilizer `tableau`, in O(n) per gate,
+from which the expectation value of any Pauli is read off directly.
+
+Circuits with measurements still go to Aer, through `execute`, which shares one
+instance of each backend per kernel and avoids transpiling circuits again.
+"""
+import numpy as np
+from numpy import cos, sin, exp, pi, sqrt
+
+from qiskit_textbook.simulator._backends import get_backend, transpiled, execute
+from qiskit_textbook.simulator._stabilizer import tableau
+
+
+def _phase(theta):
+    return np.array([[1, 0], [0, exp(1j*theta)]])
+
+
+def _rx(theta):
+    return np.array([[cos(theta/2), -1j*sin(theta/2)], [-1j*sin(theta/2), cos(theta/2)]])
+
+
+def _ry(theta):
+    return np.array([[cos(theta/2), -sin(theta/2)], [sin(theta/2), cos(theta/2)]])
+
+
+def _rz(theta):
+    return np.array([[exp(-0.5j*theta), 0], [0, exp(0.5j*theta)]])
+
+
+def _u(theta, phi, lam):
+    return np.array([[cos(theta/2), -exp(1j*lam)*sin(theta/2)],
+                     [exp(1j*phi)*sin(theta/2), exp(1j*(phi+lam))*cos(theta/2)]])
+
+
+# name -> function of the gate's parameters, returning its matrix
+_SINGLE_QUBIT_GATES = {
+    'id': lambda: np.eye(2),
+    'x': lambda: np.array([[0, 1], [1, 0]]),
+    'y': lambda: np.array([[0, -1j], [1j, 0]]),
+    'z': lambda: np.diag([1, -1]),
+    'h': lambda: np.array([[1, 1], [1, -1]])/sqrt(2),
+    's': lambda: _phase(pi/2),
+    'sdg': lambda: _phase(-pi/2),
+    't': lambda: _phase(pi/4),
+    'tdg': lambda: _phase(-pi/4),
+    'p': _phase,
+    'u1': _phase,
+    'rx': _rx,
+    'ry': _ry,
+    'rz': _rz,
+    'u': _u,
+    'u3': _u,
+}
+
+# name -> (name of the gate applied to the target, number of controls)
+_CONTROLLED_GATES = {
+    'cx': ('x', 1),
+    'cy': ('y', 1),
+    'cz': ('z', 1),
+    'ch': ('h', 1),
+    'cp': ('p', 1),
+    'ccx': ('x', 2),
+}
+
+# instructions that leave the state as it is
+_SKIPPED = {'barrier', 'delay'}
+
+
+def _axis(n, qubit):
+    # qubit 0 is the least significant bit of the index, so the last axis
+    return n - 1 - qubit
+
+
+def _apply_single(psi, u, axis):
+    """Applies the 2x2 matrix u to the given axis of psi, in place."""
+    # slices rather than integers, so that a and b are views even for one qubit
+    index = [slice(None)]*psi.ndim
+    index[axis] = slice(0, 1)
+    a = psi[tuple(index)]
+    index[axis] = slice(1, 2)
+    b = psi[tuple(index)]
+    if u[0, 1] == 0 and u[1, 0] == 0:
+        if u[0, 0] != 1:
+            a *= u[0, 0]
+        if u[1, 1] != 1:
+            b *= u[1, 1]
+    elif u[0, 0] == 0 and u[1, 1] == 0:
+        a_old = a.copy()
+        a[...] = b
+        a *= u[0, 1]
+        b[...] = a_old
+        b *= u[1, 0]
+    else:
+        a_old = a.copy()
+        a *= u[0, 0]
+        a += u[0, 1]*b
+        b *= u[1, 1]
+        b += u[1, 0]*a_old
+
+
+def _apply_matrix(psi, u, axes):
+    """Applies the matrix u, in Qiskit's ordering for qubits on `axes`, to psi in place."""
+    k = len(axes)
+    # the first of the gate's qubits is the least significant bit of u's indices
+    u = u.reshape((2,)*2*k)
+    u_in = list(range(2*k - 1, k - 1, -1))
+    u_out = list(range(k - 1, -1, -1))
+    result = np.tensordot(u, psi, axes=(u_in, axes))
+    psi[...] = np.moveaxis(result, u_out, axes)
+
+
+def _reset(psi, axes):
+    """Sets the qubits on `axes` of psi to |0⟩, in place. They must not be entangled
+    with the others, for the result to be a single statevector."""
+    k = len(axes)
+    m = np.moveaxis(psi, axes, range(k)).reshape(2**k, -1)
+    # for a product state, m is the outer product of the qubits' state and the rest's
+    rest = m[np.argmax(np.linalg.norm(m, axis=1))]
+    rest = rest/np.linalg.norm(rest)
+    if not np.allclose(np.outer(m @ rest.conj(), rest), m):
+        raise ValueError("statevector can't reset qubits that are entangled with others")
+    m = np.zeros_like(m)
+    m[0] = rest
+    psi[...] = np.moveaxis(m.reshape(psi.shape), range(k), axes)
+
+
+def apply_gate(psi, name, qubits, params=(), matrix=None):
+    """
+    Applies a gate to the state psi, an array of shape (2,)*n, in place.
+
+        name (str): Name of the gate, as in Qiskit. Gates not simulated directly
+                    need their matrix.
+        qubits (list): Indices of the qubits it acts on, in Qiskit's order.
+        params (list): The gate's parameters.
+        matrix (ndarray): The gate's unitary, in Qiskit's ordering.
+    """
+    n = psi.ndim
+    if name in _SKIPPED:
+        return
+    if name in _SINGLE_QUBIT_GATES and len(qubits) == 1:
+        _apply_single(psi, _SINGLE_QUBIT_GATES[name](*params), _axis(n, qubits[0]))
+    elif name in _CONTROLLED_GATES:
+        target, ncontrols = _CONTROLLED_GATES[name]
+        index = [slice(None)]*n
+        for control in qubits[:ncontrols]:
+            # keep the axis, so that the other axes keep their numbers
+            index[_axis(n, control)] = slice(1, 2)
+        _apply_single(psi[tuple(index)], _SINGLE_QUBIT_GATES[target](*params), _axis(n, qubits[-1]))
+    elif name == 'swap':
+        a, b = _axis(n, qubits[0]), _axis(n, qubits[1])
+        psi[...] = np.swapaxes(psi, a, b).copy()
+    elif matrix is not None:
+        _apply_matrix(psi, np.asarray(matrix), [_axis(n, q) for q in qubits])
+    else:
+        raise ValueError("No matrix given for gate '%s'" % name)
+
+
+def statevector(qc, initial_state=None, dtype=np.complex128):
+    """
+    Simulates a circuit without measurements.
+
+        qc (QuantumCircuit): The circuit.
+        initial_state (array): Statevector to start from (|0…0⟩ if None).
+        dtype: np.complex128, or np.complex64 for half the memory and faster
+               updates, at single precision.
+
+        Returns:
+            ndarray: The final statevector, in Qiskit's ordering.
+    """
+    n = qc.num_qubits
+    if initial_state is None:
+        psi = np.zeros(2**n, dtype=dtype)
+        psi[0] = 1
+    else:
+        psi = np.array(initial_state, dtype=dtype).reshape(2**n)
+    psi = psi.reshape((2,)*n)
+    index = {qubit: j for j, qubit in enumerate(qc.qubits)}
+    for gate, qargs, _ in qc.data:
+        if gate.name == 'measure':
+            raise ValueError("statevector can't simulate measurements")
+        qubits = [index[q] for q in qargs]
+        if gate.name in ('reset', 'initialize'):
+            _reset(psi, [_axis(n, q) for q in qubits])
+            if gate.name == 'reset':
+                continue
+            # the rest of initialize's definition prepares the state from |0…0⟩
+            gate = gate.definition.data[-1].operation
+        if (gate.name in _SKIPPED or gate.name == 'swap' or gate.name in _CONTROLLED_GATES
+                or (gate.name in _SINGLE_QUBIT_GATES and len(qubits) == 1)):
+            apply_gate(psi, gate.name, qubits, [float(param) for param in gate.params])
+        else:
+            # opaque gates (unitaries, state preparations, ...) are applied by their matrix,
+            # and their parameters, which needn't be numbers, aren't looked at
+            from qiskit.quantum_info import Operator
+            apply_gate(psi, gate.name, qubits, matrix=Operator(gate).data)
+    psi = psi.reshape(2**n)
+    if qc.global_phase:
+        psi *= exp(1j*float(qc.global_phase))
+    return psi
+
+
+def probabilities(qc, dtype=np.complex128):
+    """
+    Returns the probabilities of each outcome for measuring all qubits of qc,
+    as a dict of bitstrings (in Qiskit's ordering) to probabilities.
+    """
+    probs = np.abs(statevector(qc, dtype=dtype))**2
+    return {format(i, 'b').zfill(qc.num_qubits): float(probs[i]) for i in np.flatnonzero(probs > 1e-12)}
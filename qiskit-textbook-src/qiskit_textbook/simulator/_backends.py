@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import threading
+
+import numpy as np
+
+from qiskit_textbook.widgets._helpers import _lru
+
+_backends = {}
+_basis_gates = {}
+_lock = threading.Lock()
+
+# (backend name, circuit structure) -> transpiled circuit
+_transpiled = _lru(256)
+
+# Instructions every simulator runs without transpilation
+_ALWAYS_SUPPORTED = {'barrier', 'measure'}
+
+
+def get_backend(name='aer_simulator'):
+    """Returns the Aer simulator `name`. Each is created once per kernel, the
+    first time it is asked for, and shared after that."""
+    with _lock:
+        backend = _backends.get(name)
+        if backend is None:
+            from qiskit_aer import Aer
+            backend = _backends[name] = Aer.get_backend(name)
+        return backend
+
+
+def _backend_name(backend):
+    name = backend.name
+    return name() if callable(name) else name
+
+
+def _basis(backend):
+    key = _backend_name(backend)
+    with _lock:
+        if key not in _basis_gates:
+            names = getattr(backend, 'operation_names', None)
+            if names is None:
+                names = backend.configuration().basis_gates
+            _basis_gates[key] = set(names) | _ALWAYS_SUPPORTED
+        return _basis_gates[key]
+
+
+# name -> class of the instructions whose name says all there is to know about them
+# (besides their parameters), filled the first time it is needed
+_standard = {}
+
+
+def _param(param):
+    if isinstance(param, np.ndarray):
+        # e.g. the matrix of a UnitaryGate
+        return (param.shape, param.tobytes())
+    try:
+        return float(param)
+    except (TypeError, ValueError):
+        # unbound parameters, strings, complex numbers, ...
+        return repr(param)
+
+
+def _structure(qc):
+    """
+    A hashable description of everything in qc that transpilation depends on, and
+    of the registers, which name the qubits and clbits of the results. Instructions
+    other than the standard ones are described by their definitions, and the result
+    is None if one has none.
+    """
+    if not _standard:
+        from qiskit.circuit.library.standard_gates import get_standard_gate_name_mapping
+        _standard.update((name, gate.base_class) for name, gate in get_standard_gate_name_mapping().items())
+    qubits = {qubit: j for j, qubit in enumerate(qc.qubits)}
+    clbits = {clbit: j for j, clbit in enumerate(qc.clbits)}
+    instructions = []
+    for operation, qargs, cargs in qc.data:
+        if operation.name == 'barrier' or _standard.get(operation.name) is operation.base_class:
+            definition = ()
+        elif operation.definition is not None:
+            definition = _structure(operation.definition)
+            if definition is None:
+                return None
+        else:
+            return None
+        condition = getattr(operation, 'condition', None)
+        if condition is not None:
+            target, value = condition
+            if target in clbits:
+                target = clbits[target]
+            else:
+                target = (target.name, target.size, tuple(clbits[c] for c in target))
+            condition = (target, value)
+        instructions.append((operation.name, tuple(_param(param) for param in operation.params), definition,
+                             condition, tuple(qubits[q] for q in qargs), tuple(clbits[c] for c in cargs)))
+    return (qc.num_qubits, qc.num_clbits, _param(qc.global_phase),
+            tuple((register.name, register.size) for register in qc.qregs),
+            tuple((register.name, register.size) for register in qc.cregs),
+            tuple(instructions))
+
+
+def transpiled(qc, backend):
+    """
+    Returns qc, transpiled for backend. Circuits that only use the backend's basis
+    gates are returned as they are, and the others are transpiled once for each
+    structure (gates and their definitions, parameters, conditions, qubits and
+    registers) and then taken from a cache, as a copy with qc's name and metadata,
+    so that results can be looked up by qc. Circuits with gates that have no
+    definition, and so can't be told apart by their names, are never cached.
+    """
+    basis = _basis(backend)
+    if all(gate.name in basis for gate, _, _ in qc.data):
+        return qc
+    from qiskit import transpile
+    structure = _structure(qc)
+    if structure is None:
+        return transpile(qc, backend)
+    key = (_backend_name(backend), structure)
+    circuit = _transpiled.get(key)
+    if circuit is None:
+        circuit = transpile(qc, backend)
+        _transpiled.put(key, circuit)
+    if circuit.name != qc.name or circuit.metadata != qc.metadata:
+        circuit = circuit.copy(qc.name)
+        circuit.metadata = qc.metadata
+    return circuit
+
+
+def execute(qc, backend='aer_simulator', shots=1024, **run_options):
+    """
+    Like qiskit.execute, but with backends from `get_backend` and transpiled
+    circuits from `transpiled`.
+
+        qc (QuantumCircuit or list): Circuit(s) to run.
+        backend (str or Backend): The backend, or the name of an Aer simulator.
+        shots (int): Number of shots.
+
+        Returns:
+            Job: The job running the circuit(s).
+    """
+    if isinstance(backend, str):
+        backend = get_backend(backend)
+    if isinstance(qc, (list, tuple)):
+        circuits = [transpiled(circuit, backend) for circuit in qc]
+    else:
+        circuits = transpiled(qc, backend)
+    return backend.run(circuits, shots=shots, **run_options)
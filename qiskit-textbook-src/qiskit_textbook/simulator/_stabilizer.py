@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from qiskit_textbook.widgets._helpers import _lru
+
+# instructions that leave the state as it is
+_SKIPPED = {'id', 'barrier', 'delay'}
+
+# (tableau, observables) -> expectation values. Few-qubit circuits only reach a
+# few stabilizer states (60 for two qubits), so most lookups are hits.
+_expectations = _lru(4096)
+
+
+class tableau():
+    """
+    The state of n qubits after a Clifford circuit, as a stabilizer tableau
+    (Aaronson and Gottesman, arXiv:quant-ph/0406196). Each gate costs O(n), and
+    the expectation value of a Pauli, which is always 0 or ±1, costs O(n^2),
+    instead of the O(2^n) of a statevector.
+
+    Rows 0 to n-1 are the destabilizers, and rows n to 2n-1 the stabilizers. Row i
+    is (-1)^r[i] times the Pauli with X on the qubits where x[i] is set and Z on
+    those where z[i] is (Y where both are).
+
+        n (int): Number of qubits, which start in |0…0⟩.
+    """
+
+    # the gates that keep the state a stabilizer state
+    GATES = {'x', 'y', 'z', 'h', 's', 'sdg', 'cx', 'cz', 'swap'} | _SKIPPED
+
+    def __init__(self, n):
+        self.n = n
+        self.x = np.zeros((2*n, n), dtype=bool)
+        self.z = np.zeros((2*n, n), dtype=bool)
+        self.r = np.zeros(2*n, dtype=bool)
+        self.x[np.arange(n), np.arange(n)] = True
+        self.z[n + np.arange(n), np.arange(n)] = True
+
+    @classmethod
+    def from_circuit(cls, qc):
+        """The tableau for the circuit qc, or None if it has gates outside GATES."""
+        if any(gate.name not in cls.GATES for gate, _, _ in qc.data):
+            return None
+        state = cls(qc.num_qubits)
+        index = {qubit: j for j, qubit in enumerate(qc.qubits)}
+        for gate, qargs, _ in qc.data:
+            state.apply(gate.name, [index[q] for q in qargs])
+        return state
+
+    def copy(self):
+        state = tableau.__new__(tableau)
+        state.n = self.n
+        state.x, state.z, state.r = self.x.copy(), self.z.copy(), self.r.copy()
+        return state
+
+    def apply(self, name, qubits):
+        """Applies the gate `name` (one of GATES) to the given qubits, in Qiskit's order."""
+        x, z, r = self.x, self.z, self.r
+        if name in _SKIPPED:
+            return
+        a = qubits[0]
+        if name == 'x':
+            r ^= z[:, a]
+        elif name == 'z':
+            r ^= x[:, a]
+        elif name == 'y':
+            r ^= x[:, a] ^ z[:, a]
+        elif name == 'h':
+            r ^= x[:, a] & z[:, a]
+            x[:, a], z[:, a] = z[:, a].copy(), x[:, a].copy()
+        elif name == 's':
+            r ^= x[:, a] & z[:, a]
+            z[:, a] ^= x[:, a]
+        elif name == 'sdg':
+            r ^= x[:, a] & ~z[:, a]
+            z[:, a] ^= x[:, a]
+        elif name == 'cx':
+            b = qubits[1]
+            r ^= x[:, a] & z[:, b] & ~(x[:, b] ^ z[:, a])
+            x[:, b] ^= x[:, a]
+            z[:, a] ^= z[:, b]
+        elif name == 'cz':
+            # H on the target, CX, H on the target
+            for gate, gate_qubits in [('h', [qubits[1]]), ('cx', qubits), ('h', [qubits[1]])]:
+                self.apply(gate, gate_qubits)
+        elif name == 'swap':
+            b = qubits[1]
+            x[:, [a, b]] = x[:, [b, a]]
+            z[:, [a, b]] = z[:, [b, a]]
+        else:
+            raise ValueError("'%s' is not a Clifford gate that the tableau supports" % name)
+
+    def expectation(self, pauli):
+        """
+        The expectation value of a Pauli observable.
+
+            pauli (str): 'I', 'X', 'Y' or 'Z' for each qubit, with pauli[j] for qubit j.
+
+            Returns:
+                int: 0, 1 or -1.
+        """
+        return int(self.expectations([pauli])[0])
+
+    def expectations(self, paulis):
+        """The expectation values of a list of Pauli observables, as an array (see `expectation`)."""
+        key = (self.n, self.x.tobytes(), self.z.tobytes(), self.r.tobytes(), tuple(paulis))
+        values = _expectations.get(key)
+        if values is None:
+            values = self._expectations(paulis)
+            _expectations.put(key, values)
+        return values.copy()
+
+    def _expectations(self, paulis):
+        n = self.n
+        px = np.array([[p in 'XY' for p in pauli] for pauli in paulis], dtype=int).reshape(-1, n)
+        pz = np.array([[p in 'ZY' for p in pauli] for pauli in paulis], dtype=int).reshape(-1, n)
+        # whether each observable anticommutes with each row
+        anticommutes = (pz @ self.x.T + px @ self.z.T) % 2 == 1
+        # observables that commute with all stabilizers are ± the product of those
+        # whose destabilizers they anticommute with, and the others have expectation 0
+        x = np.zeros(px.shape, dtype=int)
+        z = np.zeros(pz.shape, dtype=int)
+        phase = np.zeros(len(px), dtype=int)
+        for i in range(n):
+            rows = anticommutes[:, i]
+            sx, sz = self.x[n + i].astype(int), self.z[n + i].astype(int)
+            phase[rows] += 2*self.r[n + i] + _g(sx, sz, x[rows], z[rows]).sum(axis=1)
+            x[rows] ^= sx
+            z[rows] ^= sz
+        values = np.where(phase % 4 == 0, 1, -1)
+        values[anticommutes[:, n:].any(axis=1)] = 0
+        return values
+
+
+def _g(x1, z1, x2, z2):
+    # The power of i in the product of the Paulis (x1, z1) and (x2, z2), for each qubit
+    # (as 0 or 1 integer arrays, which broadcast together).
+    return np.where(x1 & z1, z2 - x2,
+                    np.where(x1, z2*(2*x2 - 1),
+                             np.where(z1, x2*(1 - 2*z2), 0)))
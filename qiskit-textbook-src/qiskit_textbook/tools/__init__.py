@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
-from IPython.display import display, Markdown, Math
+from IPython.display import display, Markdown, Math, HTML
 from qiskit import QuantumCircuit
 import numpy as np
 import math
+import html
+import re
 from fractions import Fraction
 
+from qiskit_textbook.instrumentation import timer
+
+# Arrays and kets with more elements than this are shown as Unicode/HTML instead of
+# LaTeX, as typesetting them with MathJax can stall the browser.
+MATHJAX_LIMIT = 256
+
 def vector2latex(vector, precision=5, pretext="", display_output=True):
     """replace with array_to_latex"""
     out_latex = "\n$$ " + pretext
@@ -83,6 +91,19 @@ def random_state(nqubits):
 
 
 # +
+_COMMON_TERMS = {
+    1/math.sqrt(2): ('\\tfrac{1}{\\sqrt{2}}', '1/√2'),
+    1/math.sqrt(3): ('\\tfrac{1}{\\sqrt{3}}', '1/√3'),
+    math.sqrt(2/3): ('\\sqrt{\\tfrac{2}{3}}', '√(2/3)'),
+    math.sqrt(3/4): ('\\sqrt{\\tfrac{3}{4}}', '√(3/4)'),
+    1/math.sqrt(8): ('\\tfrac{1}{\\sqrt{8}}', '1/√8')
+}
+
+_SUPERSCRIPTS = str.maketrans('0123456789', '⁰¹²³⁴⁵⁶⁷⁸⁹')
+_SUBSCRIPTS = str.maketrans('0123456789', '₀₁₂₃₄₅₆₇₈₉')
+
+
+@timer('tools.num_to_latex')
 def num_to_latex(num, precision=5):
     """Takes a complex number as input and returns a latex representation
     
@@ -94,6 +115,26 @@ def num_to_latex(num, precision=5):
         Returns:
             str: Latex representation of num
     """
+    return _num_to_text(num, precision, unicode=False)
+
+
+@timer('tools.num_to_unicode')
+def num_to_unicode(num, precision=5):
+    """Like num_to_latex, but returns plain Unicode text (e.g. '1/√2', '³⁄₈'),
+    which needs no typesetting to display.
+    
+        Args:
+            num (numerical): The number to be converted.
+            precision (int): If the real or imaginary parts of num are not close
+                             to an integer, the number of decimal places to round to
+        
+        Returns:
+            str: Unicode representation of num
+    """
+    return _num_to_text(num, precision, unicode=True)
+
+
+def _num_to_text(num, precision, unicode):
     r = np.real(num)
     i = np.imag(num)
     common_factor = None
@@ -104,13 +145,6 @@ def num_to_latex(num, precision=5):
         r = r/common_factor
         i = i/common_factor
     
-    common_terms = {
-        1/math.sqrt(2): '\\tfrac{1}{\\sqrt{2}}',
-        1/math.sqrt(3): '\\tfrac{1}{\\sqrt{3}}',
-        math.sqrt(2/3): '\\sqrt{\\tfrac{2}{3}}',
-        math.sqrt(3/4): '\\sqrt{\\tfrac{3}{4}}',
-        1/math.sqrt(8): '\\tfrac{1}{\\sqrt{8}}'
-    }
     def proc_value(val):
         # See if val is close to an integer
         val_mod = np.mod(val, 1)
@@ -118,20 +152,25 @@ def num_to_latex(num, precision=5):
             # If so, return that integer
             return str(int(np.round(val)))
         # Otherwise, see if it matches one of the common terms
-        for term, latex_str in common_terms.items():
+        for term, strings in _COMMON_TERMS.items():
              if np.isclose(abs(val), term):
                     if val > 0:
-                        return latex_str
+                        return strings[unicode]
                     else:
-                        return "-" + latex_str
+                        return "-" + strings[unicode]
         # try to factorise val nicely
         frac = Fraction(val).limit_denominator()
         num, denom = frac.numerator, frac.denominator
         if num + denom < 20:
+            if unicode:
+                frac_string = (str(abs(num)).translate(_SUPERSCRIPTS) + "⁄"
+                               + str(abs(denom)).translate(_SUBSCRIPTS))
+            else:
+                frac_string = "\\tfrac{%i}{%i}" % (abs(num), abs(denom))
             if val > 0:
-                return ("\\tfrac{%i}{%i}" % (abs(num), abs(denom)))
+                return frac_string
             else:
-                return ("-\\tfrac{%i}{%i}" % (abs(num), abs(denom)))
+                return "-" + frac_string
         else:
             # Failing everything else, return val as a decimal
             return "{:.{}f}".format(val, precision).rstrip("0")
@@ -149,6 +188,9 @@ def num_to_latex(num, precision=5):
         imagstring = proc_value(-i)
     if imagstring == "1":
         imagstring = ""
+    if unicode and "/" in imagstring:
+        # keep 1/√2 i from reading as 1/(√2 i)
+        imagstring = "(%s)" % imagstring
     if imagstring == "0":
         return realstring
     if realstring == "0":
@@ -212,6 +254,8 @@ def array_to_latex(array, precision=5, pretext="", display_output=True):
             precision: (int) For numbers not close to integers, the number of decimal places to round to.
             pretext: (str) Latex string to be prepended to the latex, intended for labels.
             display_output: (bool) if True, uses IPython.display to display output, otherwise returns the latex string.
+                            Arrays with more than MATHJAX_LIMIT elements are displayed with array_to_html,
+                            with pretext turned into HTML.
         
         Returns:
             str: Latex representation of the array, wrapped in $$
@@ -225,6 +269,9 @@ def array_to_latex(array, precision=5, pretext="", display_output=True):
         array+1 # Test array contains numerical data
     except:
         raise ValueError("array_to_latex can only convert numpy arrays containing numerical data, or types that can be converted to such arrays")
+    if display_output and array.size > MATHJAX_LIMIT:
+        # too large to typeset quickly
+        return array_to_html(array, precision=precision, pretext=_latex_to_html(pretext))
     if array.ndim == 1:
         output = vector_to_latex(array, precision=precision, pretext=pretext)
     elif array.ndim == 2:
@@ -235,3 +282,67 @@ def array_to_latex(array, precision=5, pretext="", display_output=True):
         display(Math(output))
     else:
         return(output)
+
+
+# LaTeX commands that labels are likely to use, and the text that stands in for them in HTML
+_LATEX_SYMBOLS = {'rangle': '⟩', 'langle': '⟨', 'dagger': '†', 'otimes': '⊗', 'cdot': '·',
+                  'times': '×', 'sqrt': '√', 'quad': ' ', 'qquad': '  ', ',': ' ', ' ': ' ',
+                  'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'theta': 'θ', 'phi': 'φ', 'psi': 'ψ',
+                  'Phi': 'Φ', 'Psi': 'Ψ', 'omega': 'ω', 'pi': 'π'}
+_LATEX_COMMAND = re.compile(r'\\([A-Za-z]+|.)')
+_LATEX_SCRIPT = re.compile(r'([_^])(\{[^{}]*\}|.)')
+
+
+def _latex_to_html(latex):
+    """A readable HTML version of a LaTeX label such as pretext: symbols are replaced
+    by Unicode, scripts by <sub> and <sup>, and other markup is dropped."""
+    text = _LATEX_COMMAND.sub(lambda match: _LATEX_SYMBOLS.get(match.group(1), ''),
+                              latex.replace('$', ''))
+    parts = []
+    for j, part in enumerate(_LATEX_SCRIPT.split(text)):
+        if j % 3 == 0:
+            parts.append(html.escape(part.replace('{', '').replace('}', '')))
+        elif j % 3 == 2:
+            tag = 'sub' if parts.pop() == '_' else 'sup'
+            parts.append('<%s>%s</%s>' % (tag, html.escape(part.strip('{}')), tag))
+        else:
+            parts.append(part)
+    return ''.join(parts)
+
+
+def array_to_html(array, precision=5, pretext="", display_output=True):
+    """HTML representation of a complex numpy array (with dimension 1 or 2), with
+    the numbers written as by num_to_unicode. Unlike array_to_latex, the output
+    needs no typesetting, so this stays fast for large arrays.
+    
+        Args:
+            array (ndarray): The array to be converted to HTML, must have dimension 1 or 2.
+            precision: (int) For numbers not close to integers, the number of decimal places to round to.
+            pretext: (str) HTML to be placed before the array, intended for labels.
+            display_output: (bool) if True, uses IPython.display to display output, otherwise returns the HTML string.
+        
+        Returns:
+            str: HTML representation of the array
+        
+        Raises:
+            ValueError: If the dimension of array is not 1 or 2
+    """
+    array = np.asarray(array)
+    if array.ndim == 1:
+        rows = array[:, None]
+    elif array.ndim == 2:
+        rows = array
+    else:
+        raise ValueError("array_to_html can only convert numpy ndarrays of dimension 1 or 2")
+    out_string = ('<div style="display: flex; align-items: center; font-family: serif">{}'
+                  '<table style="border-left: 1px solid; border-right: 1px solid; '
+                  'border-collapse: separate">\n').format(pretext)
+    for row in rows:
+        out_string += "<tr>" + "".join('<td style="text-align: center">%s</td>'
+                                       % num_to_unicode(amplitude, precision=precision)
+                                       for amplitude in row) + "</tr>\n"
+    out_string += "</table></div>\n"
+    if display_output:
+        display(HTML(out_string))
+    else:
+        return out_string
@@ -1,13 +1,192 @@
 #!/usr/bin/env python3 
 # -*- coding: utf-8 -*-
 import ipywidgets as widgets
-from IPython.display import display, clear_output, Math
-from qiskit.visualization import plot_bloch_vector
+from IPython.display import display, clear_output
+from qiskit.visualization import plot_state_qsphere
 from numpy import sqrt, cos, sin, pi
+import numpy as np
 import numexpr
-import re
+from numbers import Integral
+
+from qiskit_textbook.widgets._helpers import _pre, _img, _busy, _transaction, _lru, _phase, _figure, _detached, figure_pool, executor
+from qiskit_textbook.widgets._bloch import _bloch_sphere
+from qiskit_textbook.widgets.grading import grade_state_vectors
+from qiskit_textbook.widgets._oracles import _oracle_action, _phase_register, _bv_register
+from qiskit_textbook.tools import num_to_latex, num_to_unicode, MATHJAX_LIMIT
+
+
+def _plot_bloch(bloch, title="", path=None):
+    """Same picture as plot_bloch_vector, as an RGBA image drawn over a cached sphere"""
+    with _phase('draw'):
+        return _bloch_sphere.get(title).draw(bloch, path=path)
+
+
+def _rgba_figure(rgba):
+    """Puts an RGBA image on a new figure, for functions that return figures"""
+    fig = _figure(figsize=(rgba.shape[1]/100, rgba.shape[0]/100), dpi=100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.imshow(rgba)
+    ax.axis('off')
+    return fig
+
+
+def _bloch_cartesian(coords, coord_type='spherical'):
+    """Converts an array of shape (N, 3) of Bloch coordinates to Cartesian
+    ones, returned as an array of shape (3, N)"""
+    coords = np.atleast_2d(np.asarray(coords, dtype=float)).T
+    if coord_type == 'cartesian':
+        return coords
+    elif coord_type == 'spherical':
+        theta, phi, r = coords
+        return np.stack([r*sin(theta)*cos(phi), r*sin(theta)*sin(phi), r*cos(theta)])
+    raise ValueError("coord_type must be 'spherical' or 'cartesian'")
+
+
+def _plot_qsphere(state, key='qsphere'):
+    """Same as plot_state_qsphere, but drawn on a figure from figure_pool"""
+    with _phase('draw'):
+        fig = figure_pool.get(key, figsize=(7, 7))
+        ax = fig.add_subplot()
+        plot_state_qsphere(state, ax=ax)
+        # plot_state_qsphere only uses `ax` to find the figure, and adds axes of its own
+        fig.delaxes(ax)
+    return fig
+
+
+def _canonical_state(state, decimals=6):
+    """Bytes that identify a statevector up to global phase"""
+    state = np.asarray(state, dtype=complex)
+    first = state[np.argmax(np.abs(state) > 10**-decimals)]
+    state = np.round(state*abs(first)/first, decimals)
+    # adding zero turns -0.0 into 0.0, so that equal states give equal bytes
+    return (state + 0.0).tobytes()
+
+
+# Images rendered by gate_demo, keyed by (qsphere, canonical state)
+_state_images = _lru(512)
+
+_GATE_DEMO_MATRICES = {
+    'I': np.eye(2),
+    'X': np.array([[0, 1], [1, 0]]),
+    'Y': np.array([[0, -1j], [1j, 0]]),
+    'Z': np.diag([1, -1]),
+    'H': np.array([[1, 1], [1, -1]])/sqrt(2),
+    'S': np.diag([1, 1j]),
+    'Sdg': np.diag([1, -1j]),
+    'T': np.diag([1, np.exp(1j*pi/4)]),
+    'Tdg': np.diag([1, np.exp(-1j*pi/4)]),
+}
+
+
+# Tokens for writing kets as LaTeX (for MathJax) or as plain Unicode/HTML
+_KET_STYLES = {
+    'latex': {'num': num_to_latex, 'ket': "|%s\\rangle", 'otimes': "\\otimes",
+              'plus': "|{+}\\rangle", 'minus': "|{-}\\rangle",
+              'too_large': "\\text{(Too large to display)}", 'more': "+ \\dots \\text{(%i more terms)}"},
+    'unicode': {'num': num_to_unicode, 'ket': "|%s⟩", 'otimes': "⊗",
+                'plus': "|+⟩", 'minus': "|−⟩", 'too_large': "(Too large to display)",
+                'more': "+ … (%i more terms)"},
+}
+
+# Kets with more terms than this are cut short
+_MAX_KET_TERMS = 1024
+
+# The LaTeX used for the operators applied in bv_widget and dj_widget
+_OPS_TO_HTML = [("|{-}\\rangle", "|−⟩"), ("H^{\\otimes n}", "H<sup>⊗n</sup>"),
+                ("U_f", "U<sub>f</sub>"), ("\\otimes", "⊗"), ("\\rangle", "⟩")]
+
+
+def _vec_in_braket(vec, nqubits, display_ancilla, style='latex'):
+    tokens = _KET_STYLES[style]
+    scalfac = ""
+    tensorfac = ""
+    state = ""
+    # Factor out separable 'output' qubit if possible
+    if nqubits > 1:
+        vfirst = vec[:2**nqubits//2]
+        vlast = vec[2**nqubits//2:]
+        if np.allclose(vfirst, 0):
+            vec = vlast
+            tensorfac += tokens['ket'] % "1"
+            nqubits -= 1
+        elif np.allclose(vlast, 0):
+            vec = vfirst
+            tensorfac += tokens['ket'] % "0"
+            nqubits -= 1
+        elif np.allclose(vfirst, vlast):
+            vec = vfirst*np.sqrt(2)
+            tensorfac += tokens['plus']
+            nqubits -= 1
+        elif np.allclose(vfirst, -vlast):
+            vec = vfirst*np.sqrt(2)
+            tensorfac += tokens['minus']
+            nqubits -= 1
+
+    if np.allclose(np.abs(vec), np.abs(vec[0])):
+        scalfac = tokens['num'](vec[0])
+        vec = vec/vec[0]
+
+    nonzero = np.flatnonzero(~np.isclose(vec, 0))
+    for i in nonzero[:_MAX_KET_TERMS]:
+        basis = format(i, 'b').zfill(nqubits)
+        if not np.isclose(vec[i], 1):
+            if np.isclose(vec[i], -1):
+                if state.endswith("+ "):
+                    state = state[:-2]
+                state += "-"
+            else:
+                state += tokens['num'](vec[i])
+        state += tokens['ket'] % basis + " + "
+    state = state.replace("j", "i")
+    state = state[:-2]
+    if len(nonzero) > _MAX_KET_TERMS:
+        state += tokens['more'] % (len(nonzero) - _MAX_KET_TERMS)
+    if style == 'latex' and len(state) > 5000:
+        return tokens['too_large']
+    if scalfac != "" or (tensorfac != "" and len(state)>(9+nqubits) and display_ancilla):
+        state = ("(%s)" % state)
+    if scalfac != "":
+        state = scalfac + state
+    if tensorfac != "" and display_ancilla:
+        state =  tensorfac + tokens['otimes'] + state
+    return state
+
+
+def _bv_ket(register, display_ancilla):
+    """LaTeX for the state of a _bv_register, written with a sum over x if it
+    is a superposition, so that it stays short for any number of qubits."""
+    a = format(register.a, 'b').zfill(register.n)
+    state = "-" if register.sign < 0 else ""
+    if register.kind == 'basis':
+        state += "|%s\\rangle" % a
+    else:
+        state += "\\tfrac{1}{\\sqrt{2^{%i}}}\\sum_{x}" % register.n
+        if register.a != 0:
+            state += "(-1)^{%s \\cdot x}" % a
+        state += "|x\\rangle"
+    if display_ancilla:
+        state = "|{-}\\rangle\\otimes" + state
+    return state
+
+
+def _ket_equation(ops, register, display_ancilla):
+    """Returns the ket of the input and output qubits of `register` (see _oracles),
+    and the equation `ops` = ket to show for it: in LaTeX, or in plain HTML if the
+    ket has too many terms for MathJax to typeset quickly."""
+    if isinstance(register, _bv_register) and 2**register.n > MATHJAX_LIMIT:
+        vec = _bv_ket(register, display_ancilla)
+        return vec, "$$ %s = %s $$" % (ops, vec)
+    statevec = register.statevector()
+    nqubits = register.n + 1
+    if np.count_nonzero(~np.isclose(statevec, 0)) <= MATHJAX_LIMIT:
+        vec = _vec_in_braket(statevec, nqubits, display_ancilla)
+        return vec, "$$ %s = %s $$" % (ops, vec)
+    vec = _vec_in_braket(statevec, nqubits, display_ancilla, style='unicode')
+    for latex, html in _OPS_TO_HTML:
+        ops = ops.replace(latex, html)
+    return vec, ('<div style="font-family: serif; font-size: 1.2em; text-align: center">'
+                 '%s = %s</div>' % (ops, vec))
 
-from qiskit_textbook.widgets._helpers import _pre, _img
 
 def binary_widget(nbits=5):
     nbits = max(min(10, nbits), 2) # Keep nbits between 2 and 10
@@ -52,22 +231,8 @@ def state_vector_exercise(target):
     label = widgets.Label(value="State Vector:")
 
     def on_button_click(b):
-        try:
-            state_vector = text_input.value.strip("[]").replace(" ", "").split(",")
-            c1, c2 = numexpr.evaluate(state_vector[0]), numexpr.evaluate(state_vector[1])
-        except Exception as e:
-            output.value = str(e).split("(")[0]
-            return
-
-        squared_magnitude = abs(c1)**2 + abs(c2)**2
-        p = abs(c1)**2
-        if not (squared_magnitude < 1.01 and squared_magnitude > .99): # Close Enough
-            output.value = "Magnitude is not equal to 1"
-            return
-        elif p > target*0.99 and p < target*1.01:
-            output.value = "Correct!"
-        else:
-            output.value = "The absolute value of " + str(c1) + ", squared is not equal to " + str(target)
+        # graded as in qiskit_textbook.widgets.grading, which grades answers in bulk
+        output.value = grade_state_vectors([text_input.value], target)[0]['message']
 
     hbox = widgets.HBox([text_input, button])
     vbox = widgets.VBox([label, hbox])
@@ -77,7 +242,9 @@ def state_vector_exercise(target):
     display(output.widget)
 
 
-def bloch_calc():
+def bloch_calc(animate=False, steps=40):
+    """With animate=True, the vector moves to each new state along the way
+    the angles change, leaving a trail, over `steps` frames."""
     output = _pre()
     button = widgets.Button(description="Plot", layout=widgets.Layout(width='4em'))
     theta_input = widgets.Text(label='$\\theta$',
@@ -88,7 +255,12 @@ def bloch_calc():
                              disabled=False)
 
     label = widgets.Label(value="Define a qubit state using $\\theta$ and $\phi$:")
-    image = _img(value=plot_bloch_vector([0, 0, 1]))
+    # frames of an animation are encoded with fast, light compression
+    image = _img(value=_plot_bloch([0, 0, 1]), compress_level=1 if animate else None)
+    busy = _busy()
+    angles = [0, 0]
+    def show(data):
+        image.data = data
     def on_button_click(b):
         from math import pi, sqrt
         try:
@@ -107,13 +279,24 @@ def bloch_calc():
             y = 0
         if abs(z) < 0.0001:
             z = 0
-        output.value = "x = r * sin(" + theta_input.value + ") * cos(" + phi_input.value + ")\n"
-        output.value += "y = r * sin(" + theta_input.value + ") * sin(" + phi_input.value + ")\n"
-        output.value += "z = r * cos(" + theta_input.value + ")\n\n"
-        output.value += "Cartesian Bloch Vector = [" + str(x) + ", " + str(y) + ", " + str(z) + "]"
-        image.value = plot_bloch_vector([x,y,z])
+        with _transaction(output):
+            output.value = "x = r * sin(" + theta_input.value + ") * cos(" + phi_input.value + ")\n"
+            output.value += "y = r * sin(" + theta_input.value + ") * sin(" + phi_input.value + ")\n"
+            output.value += "z = r * cos(" + theta_input.value + ")\n\n"
+            output.value += "Cartesian Bloch Vector = [" + str(x) + ", " + str(y) + ", " + str(z) + "]"
+        if animate:
+            coords = np.column_stack([np.linspace(angles[0], theta, steps),
+                                      np.linspace(angles[1], phi, steps),
+                                      np.ones(steps)])
+            path = _bloch_cartesian(coords)
+            def render(k):
+                return image.encode(_plot_bloch(path[:, k], path=path[:, :k+1]))
+            executor.stream(image, render, range(steps), show, busy=busy)
+        else:
+            image.submit(_plot_bloch, [x,y,z], busy=busy)
+        angles[:] = [float(theta), float(phi)]
 
-    hbox = widgets.HBox([phi_input, button])
+    hbox = widgets.HBox([phi_input, button, busy.widget])
     vbox = widgets.VBox([label, theta_input, hbox])
     button.on_click(on_button_click)
     display(vbox)
@@ -123,12 +306,25 @@ def bloch_calc():
 
 def plot_bloch_vector_spherical(coords):
     clear_output()
-    theta, phi, r = coords[0], coords[1], coords[2]
-    x = r*sin(theta)*cos(phi)
-    y = r*sin(theta)*sin(phi)
-    z = r*cos(theta)
-    output = widgets.Output()
-    return plot_bloch_vector([x,y,z])
+    bloch = _bloch_cartesian(coords)[:, 0]
+    return _rgba_figure(_plot_bloch(bloch))
+
+
+def plot_bloch_trajectory(coords, coord_type='spherical', title=""):
+    """Plots a sequence of Bloch vectors as a single trajectory on one sphere,
+    with an arrow to the last vector.
+
+        Args:
+            coords (array_like): Array of shape (N, 3), with rows of (theta, phi, r) for
+                                 coord_type='spherical', or of (x, y, z) for 'cartesian'.
+            coord_type (str): 'spherical' or 'cartesian'.
+            title (str): Title shown above the sphere.
+
+        Returns:
+            Figure: The plot.
+    """
+    path = _bloch_cartesian(coords, coord_type)
+    return _rgba_figure(_plot_bloch(path[:, -1], title, path=path))
 
 
 def scalable_circuit(func):
@@ -138,24 +334,25 @@ def scalable_circuit(func):
     def interactive_function(n):
         qc = QuantumCircuit(n)
         func(qc, n)
-        return qc.draw('mpl')
+        return _detached(qc.draw, 'mpl')
     
     from ipywidgets import IntSlider
     # Ideally this would use `interact` from ipywidgets but this is
     # incompatible with thebe lab
-    image = _img()
+    image = _img(skip_unchanged=True)
+    busy = _busy()
     n_slider = IntSlider(min=1,max=8,step=1,value=4)
     image.value = interactive_function(n_slider.value)
     def update_output(b):
-        image.value = interactive_function(n_slider.value)
+        image.submit(interactive_function, n_slider.value, busy=busy)
     n_slider.observe(update_output)
-    display(n_slider)
+    display(widgets.HBox([n_slider, busy.widget]))
     display(image.widget)
 
 
 def gate_demo(gates='full', qsphere=False):
-    from qiskit import QuantumCircuit, execute, Aer
-    from qiskit.visualization import plot_bloch_multivector, plot_state_qsphere
+    from qiskit import QuantumCircuit
+    from qiskit_textbook.simulator import statevector
     gate_list = []
     showing_p = False
     gates = gates.split('+')
@@ -169,17 +366,43 @@ def gate_demo(gates='full', qsphere=False):
         gate_list = ['I','X','Y','Z','H','S','Sdg','T','Tdg']
         showing_p = True
 
-    backend = Aer.get_backend('statevector_simulator')
     qc = QuantumCircuit(1)
     button_list = [widgets.Button(description=gate, layout=widgets.Layout(width='3em', height='3em')) for gate in gate_list]
     button_list.append(widgets.Button(description='Reset', layout=widgets.Layout(width='6em', height='3em')))
-    image = _img()
+    image = _img(skip_unchanged=True)
+    busy = _busy()
+    def state_image(state):
+        # The gates form a small set of states (up to global phase) that are
+        # visited again and again, so their images are cached
+        key = (qsphere, _canonical_state(state))
+        data = _state_images.get(key)
+        if data is None:
+            if qsphere: 
+                data = image.encode(_plot_qsphere(state))
+            else:
+                a, b = state
+                bloch = [2*(a.conjugate()*b).real, 2*(a.conjugate()*b).imag, abs(a)**2 - abs(b)**2]
+                data = image.encode(_plot_bloch(bloch, "qubit 0"))
+            _state_images.put(key, data)
+        return data
+
+    def render(qc):
+        with _phase('simulate'):
+            out_state = statevector(qc)
+        return out_state, state_image(out_state)
+
+    def prefetch(state):
+        # fill the cache for every state that is one click away
+        for gate in gate_list:
+            state_image(_GATE_DEMO_MATRICES[gate] @ state)
+
+    def show(result):
+        state, image.data = result
+        executor.prefetch(prefetch, prefetch, state)
+
     def update_output():
-        out_state = execute(qc,backend).result().get_statevector()
-        if qsphere: 
-            image.value = plot_state_qsphere(out_state)
-        else:
-            image.value = plot_bloch_multivector(out_state)
+        # the circuit is copied, as it may change before the background work is done
+        executor.submit(image, render, qc.copy(), done=show, busy=busy)
 
     def apply_gates(b,qc):
         functionmap = {
@@ -220,10 +443,10 @@ def gate_demo(gates='full', qsphere=False):
 
     if showing_p:
         top_box = widgets.HBox(button_list)
-        bottom_box = widgets.HBox([p_button, zrot_slider])
+        bottom_box = widgets.HBox([p_button, zrot_slider, busy.widget])
         main_box = widgets.VBox([top_box, bottom_box])
     else:
-        main_box = widgets.HBox(button_list)
+        main_box = widgets.HBox(button_list + [busy.widget])
 
     display(main_box)
     display(image.widget)
@@ -237,11 +460,10 @@ def bv_widget(nqubits, hidden_string, display_ancilla=False, hide_oracle=True):
         difference = len(hidden_string) - nqubits
         hidden_string = hidden_string[difference:]
         print("Error: s is too long, trimming the first %i bits and using '%s' instead." % (difference, hidden_string))
-    import numpy as np
-    from qiskit_textbook.tools import num_to_latex, array_to_latex
-    from qiskit import QuantumCircuit, Aer, execute
-    backend = Aer.get_backend('statevector_simulator')
+    from qiskit import QuantumCircuit
     nqubits += 1
+    # the state is tracked analytically, rather than simulated, so any number of qubits is quick
+    register = _bv_register(nqubits-1, int(hidden_string[::-1] or "0", 2))
     if hide_oracle:
         oracle_qc = QuantumCircuit(nqubits)
         q = 0
@@ -263,64 +485,14 @@ def bv_widget(nqubits, hidden_string, display_ancilla=False, hide_oracle=True):
                 self.vec = "|" + "0"*(nqubits-1) + "\\rangle"
     
     msg = Message()
-    def vec_in_braket(vec, nqubits):
-        scalfac = ""
-        tensorfac = ""
-        state = ""
-        # Factor out separable 'output' qubit if possible
-        if nqubits > 1:
-            vfirst = vec[:2**nqubits//2]
-            vlast = vec[2**nqubits//2:]
-            if np.allclose(vfirst, 0):
-                vec = vlast
-                tensorfac += "|1\\rangle"
-                nqubits -= 1
-            elif np.allclose(vlast, 0):
-                vec = vfirst
-                tensorfac += "|0\\rangle"
-                nqubits -= 1
-            elif np.allclose(vfirst, vlast):
-                vec = vfirst*np.sqrt(2)
-                tensorfac += "|{+}\\rangle"
-                nqubits -= 1
-            elif np.allclose(vfirst, -vlast):
-                vec = vfirst*np.sqrt(2)
-                tensorfac += "|{-}\\rangle"
-                nqubits -= 1
-
-        if np.allclose(np.abs(vec), np.abs(vec[0])):
-            scalfac = num_to_latex(vec[0])
-            vec = vec/vec[0]
-
-        for i in range(len(vec)):
-            if not np.isclose(vec[i], 0):
-                basis = format(i, 'b').zfill(nqubits)
-                if not np.isclose(vec[i], 1):
-                    if np.isclose(vec[i], -1):
-                        if state.endswith("+ "):
-                            state = state[:-2]
-                        state += "-"
-                    else:
-                        state += num_to_latex(vec[i])
-                state += "|" + basis +"\\rangle + "
-        state = state.replace("j", "i")
-        state = state[:-2]
-        if len(state) > 5000:
-            return "\\text{(Too large to display)}"
-        if scalfac != "" or (tensorfac != "" and len(state)>(9+nqubits) and display_ancilla):
-            state = ("(%s)" % state)
-        if scalfac != "":
-            state = scalfac + state
-        if tensorfac != "" and display_ancilla:
-            state =  tensorfac + "\otimes" + state
-        return state
-
-
     def hadamards(qc, nqubits):
         for q in range(nqubits-1):
             qc.h(q)
+        with _phase('simulate'):
+            register.hadamards()
 
     def oracle(qc, nqubits):
+        # the state only changes once the circuit has
         if hide_oracle:
             qc.append(oracle_gate, range(nqubits))
         else:
@@ -331,12 +503,21 @@ def bv_widget(nqubits, hidden_string, display_ancilla=False, hide_oracle=True):
                     qc.cx(q,nqubits-1)
                 q += 1
             qc.barrier()
+        with _phase('simulate'):
+            register.oracle()
     
+    def render(qc, register, ops):
+        with _phase('format'):
+            vec, equation = _ket_equation(ops, register, display_ancilla)
+        return vec, equation, image.encode(_detached(qc.draw, 'mpl'))
+
+    def show(result):
+        with _transaction(html_math, image):
+            msg.vec, html_math.value, image.data = result
+
     def update_output():
-        statevec = execute(qc, backend).result().get_statevector()
-        msg.vec = vec_in_braket(statevec, nqubits)
-        html_math.value = "$$ %s = %s $$" % (msg.ops, msg.vec)
-        image.value = qc.draw('mpl')
+        # the circuit and state are copied, as they may change before the background work is done
+        executor.submit(image, render, qc.copy(), register.copy(), msg.ops, done=show, busy=busy)
     
     def on_hads_click(b):
         hadamards(qc, nqubits)
@@ -356,6 +537,7 @@ def bv_widget(nqubits, hidden_string, display_ancilla=False, hide_oracle=True):
     def on_clear_click(b):
         for i in range(len(qc.data)-2):
             qc.data.pop()
+        register.reset()
         msg.__init__()
         update_output()
     
@@ -366,33 +548,54 @@ def bv_widget(nqubits, hidden_string, display_ancilla=False, hide_oracle=True):
     clear_btn = widgets.Button(description="Clear")
     clear_btn.on_click(on_clear_click)
         
-    hbox = widgets.HBox([hads_btn, oracle_btn, clear_btn])
+    busy = _busy()
+    hbox = widgets.HBox([hads_btn, oracle_btn, clear_btn, busy.widget])
     html_math = widgets.HTMLMath()
     html_math.value = "$$ %s = %s $$" % (msg.ops, msg.vec)
     image = _img()
-    image.value = qc.draw('mpl')
+    image.value = _detached(qc.draw, 'mpl')
     display(hbox, html_math, image.widget)
 
 
 def dj_widget(size="small", case="balanced", display_ancilla=False, hide_oracle=True):
-    size, case = size.lower(), case.lower()
+    """`size` is "small" (2 input qubits), "large" (4 input qubits), or any
+    number of input qubits, for a randomly chosen oracle."""
+    # a number of qubits (but not a bool, which is also an Integral)
+    counted = isinstance(size, Integral) and not isinstance(size, bool)
+    if isinstance(size, str):
+        size = size.lower()
+    elif counted:
+        size = int(size)
+    case = case.lower()
     if case not in ["balanced", "constant"]:
         print("Error: `case` must be 'balanced' or 'constant'")
         return
-    if size not in ["small", "large"]:
-        print("Error: `size` must be 'small' or 'large'")
+    if not (size in ["small", "large"] or (counted and size >= 1)):
+        print("Error: `size` must be 'small', 'large' or a number of qubits")
         return
-    import numpy as np
     import random
-    from qiskit_textbook.tools import num_to_latex, array_to_latex
     from qiskit_textbook.problems import dj_problem_oracle
-    from qiskit import QuantumCircuit, Aer, execute
+    from qiskit import QuantumCircuit
     if case == 'balanced':
         problem = random.choice([1,3,4])
     else:
         problem = 2
-    backend = Aer.get_backend('statevector_simulator')
-    if size == "small":
+    if counted:
+        oracle = QuantumCircuit(size+1)
+        if case == "balanced":
+            # the parity of the input, with a random set of its bits flipped
+            flips = [q for q in range(size) if random.random() < 0.5]
+            for q in flips:
+                oracle.x(q)
+            for q in range(size):
+                oracle.cx(q, size)
+            for q in flips:
+                oracle.x(q)
+        elif random.random() < 0.5:
+            oracle.x(size)
+        else:
+            oracle.id(size)
+    elif size == "small":
         oracle = QuantumCircuit(3)
         if case == "balanced":
             if problem == 1:
@@ -408,15 +611,19 @@ def dj_widget(size="small", case="balanced", display_ancilla=False, hide_oracle=
                 oracle.x(0)
                 oracle.x(1)
         else:
-            oracle.i(2)
+            oracle.id(2)
     else:
         oracle = dj_problem_oracle(problem, to_gate=False)
-    if hide_oracle:
-        oracle = oracle.to_gate()
-    if size == "small":
+    if counted:
+        nqubits = size + 1
+    elif size == "small":
         nqubits = 3
     else:
         nqubits = 5
+    # the state is tracked analytically, rather than simulated, so any number of qubits is quick
+    register = _phase_register(*_oracle_action(oracle, nqubits-1))
+    if hide_oracle:
+        oracle = oracle.to_gate()
     qc = QuantumCircuit(nqubits)
     qc.h(nqubits-1)
     qc.z(nqubits-1)
@@ -430,76 +637,35 @@ def dj_widget(size="small", case="balanced", display_ancilla=False, hide_oracle=
                 self.vec = "|" + "0"*(nqubits-1) + "\\rangle"
     
     msg = Message()
-    def vec_in_braket(vec, nqubits):
-        scalfac = ""
-        tensorfac = ""
-        state = ""
-        # Factor out separable 'output' qubit if possible
-        if nqubits > 1:
-            vfirst = vec[:2**nqubits//2]
-            vlast = vec[2**nqubits//2:]
-            if np.allclose(vfirst, 0):
-                vec = vlast
-                tensorfac += "|1\\rangle"
-                nqubits -= 1
-            elif np.allclose(vlast, 0):
-                vec = vfirst
-                tensorfac += "|0\\rangle"
-                nqubits -= 1
-            elif np.allclose(vfirst, vlast):
-                vec = vfirst*np.sqrt(2)
-                tensorfac += "|{+}\\rangle"
-                nqubits -= 1
-            elif np.allclose(vfirst, -vlast):
-                vec = vfirst*np.sqrt(2)
-                tensorfac += "|{-}\\rangle"
-                nqubits -= 1
-
-        if np.allclose(np.abs(vec), np.abs(vec[0])):
-            scalfac = num_to_latex(vec[0])
-            vec = vec/vec[0]
-
-        for i in range(len(vec)):
-            if not np.isclose(vec[i], 0):
-                basis = format(i, 'b').zfill(nqubits)
-                if not np.isclose(vec[i], 1):
-                    if np.isclose(vec[i], -1):
-                        if state.endswith("+ "):
-                            state = state[:-2]
-                        state += "-"
-                    else:
-                        state += num_to_latex(vec[i])
-                state += "|" + basis +"\\rangle + "
-        state = state.replace("j", "i")
-        state = state[:-2]
-        if len(state) > 5000:
-            return "\\text{(Too large to display)}"
-        if scalfac != "" or (tensorfac != "" and len(state)>(9+nqubits) and display_ancilla):
-            state = ("(%s)" % state)
-        if scalfac != "":
-            state = scalfac + state
-        if tensorfac != "" and display_ancilla:
-            state =  tensorfac + "\otimes" + state
-        return state
-
-
     def hadamards(qc, nqubits):
         for q in range(nqubits-1):
             qc.h(q)
+        with _phase('simulate'):
+            register.hadamards()
 
     def apply_oracle(qc, nqubits):
+        # the state only changes once the circuit has
         if hide_oracle:
             qc.append(oracle, range(nqubits))
         else:
             qc.barrier()
-            qc += oracle
+            qc.compose(oracle, inplace=True)
             qc.barrier()
+        with _phase('simulate'):
+            register.oracle()
     
+    def render(qc, register, ops):
+        with _phase('format'):
+            vec, equation = _ket_equation(ops, register, display_ancilla)
+        return vec, equation, image.encode(_detached(qc.draw, 'mpl'))
+
+    def show(result):
+        with _transaction(html_math, image):
+            msg.vec, html_math.value, image.data = result
+
     def update_output():
-        statevec = execute(qc, backend).result().get_statevector()
-        msg.vec = vec_in_braket(statevec, nqubits)
-        html_math.value = "$$ %s = %s $$" % (msg.ops, msg.vec)
-        image.value = qc.draw('mpl')
+        # the circuit and state are copied, as they may change before the background work is done
+        executor.submit(image, render, qc.copy(), register.copy(), msg.ops, done=show, busy=busy)
     
     def on_hads_click(b):
         hadamards(qc, nqubits)
@@ -519,6 +685,7 @@ def dj_widget(size="small", case="balanced", display_ancilla=False, hide_oracle=
     def on_clear_click(b):
         for i in range(len(qc.data)-2):
             qc.data.pop()
+        register.reset()
         msg.__init__()
         update_output()
     
@@ -529,11 +696,12 @@ def dj_widget(size="small", case="balanced", display_ancilla=False, hide_oracle=
     clear_btn = widgets.Button(description="Clear")
     clear_btn.on_click(on_clear_click)
         
-    hbox = widgets.HBox([hads_btn, oracle_btn, clear_btn])
+    busy = _busy()
+    hbox = widgets.HBox([hads_btn, oracle_btn, clear_btn, busy.widget])
     html_math = widgets.HTMLMath()
     html_math.value = "$$ %s = %s $$" % (msg.ops, msg.vec)
     image = _img()
-    image.value = qc.draw('mpl')
+    image.value = _detached(qc.draw, 'mpl')
     display(hbox, html_math, image.widget)
 
 
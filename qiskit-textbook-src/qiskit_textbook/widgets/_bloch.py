@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import threading
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
+from matplotlib.patches import FancyArrowPatch
+from mpl_toolkits.mplot3d import proj3d
+from qiskit.visualization.bloch import Bloch
+
+from qiskit_textbook.widgets._helpers import _figure
+
+
+class _bloch_sphere():
+    """
+    Draws Bloch vectors the way plot_bloch_vector does, but much faster.
+
+    The sphere, its wireframe and labels are rendered once and kept as a
+    raster background. Each call to `draw` restores that background, and
+    draws only the arrow, point and trajectory on top of it, projected with
+    the view the background was rendered with. Use `get` to share spheres of the
+    same style and size.
+
+        title (str): Title shown above the sphere.
+        figsize (tuple): Figure size in inches.
+        dpi (float): Resolution of the raster (matplotlib's default if None).
+        font_size (float): Font size of the axis labels (qiskit's default if None).
+    """
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, title="", figsize=(5, 5), dpi=None, font_size=None):
+        key = (title, tuple(figsize), dpi, font_size)
+        with cls._cache_lock:
+            if key not in cls._cache:
+                cls._cache[key] = cls(title, figsize, dpi, font_size)
+            return cls._cache[key]
+
+    def __init__(self, title="", figsize=(5, 5), dpi=None, font_size=None):
+        self._lock = threading.Lock()
+        self.fig = _figure(figsize=figsize, dpi=dpi)
+        if title:
+            # leave room for the title, as plot_bloch_multivector does
+            self.ax = self.fig.add_subplot(projection='3d')
+        else:
+            # the same placement as the axes plot_bloch_vector makes for itself
+            self.ax = self.fig.add_axes([0, 0, 1, 1], projection='3d')
+        style = Bloch(axes=self.ax, font_size=font_size)
+        style.render(title=title)
+        self.fig.canvas.draw()
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._proj = self.ax.M.copy()
+
+        self.arrow = FancyArrowPatch((0, 0), (0, 0),
+                                     mutation_scale=style.vector_mutation,
+                                     lw=style.vector_width,
+                                     arrowstyle=style.vector_style,
+                                     color=style.vector_color[0],
+                                     animated=True)
+        self.ax.add_artist(self.arrow)
+        # a 2D line, placed with projected coordinates like the arrow (a 3D line
+        # from ax.plot would ignore set_data)
+        self.point = Line2D([], [], marker='o', linestyle='', color=style.vector_color[0],
+                            markersize=6, animated=True)
+        self.ax.add_artist(self.point)
+        self.path = LineCollection([], lw=2, animated=True)
+        self.ax.add_collection(self.path)
+        self._path_color = to_rgba(style.vector_color[1])
+
+    def project(self, bloch):
+        """Projects Cartesian Bloch coordinates (arrays of shape (3, ...))
+        to the 2D data coordinates of the cached view."""
+        x, y, z = np.asarray(bloch, dtype=float)
+        # Bloch swaps -x and y for plotting purposes
+        xs, ys, _ = proj3d.proj_transform(y, -x, z, self._proj)
+        return xs, ys
+
+    def draw(self, bloch, point=False, path=None):
+        """Returns an RGBA image (array of shape (height, width, 4)) of the
+        sphere with the vector `bloch` drawn on it (unless it is None), with a
+        point at its tip if `point` is True. `path` is an array of shape (3, N)
+        with points of a trajectory, drawn as a single line collection that
+        fades towards its start."""
+        with self._lock:
+            canvas = self.fig.canvas
+            canvas.restore_region(self._background)
+            if path is not None and np.shape(path)[1] > 1:
+                xs, ys = self.project(path)
+                points = np.column_stack([xs, ys])
+                self.path.set_segments(np.stack([points[:-1], points[1:]], axis=1))
+                colors = np.tile(self._path_color, (len(xs) - 1, 1))
+                colors[:, 3] = np.linspace(0.2, 1, len(xs) - 1)
+                self.path.set_color(colors)
+                self.ax.draw_artist(self.path)
+            if bloch is not None:
+                xs, ys = self.project(np.column_stack([[0, 0, 0], bloch]))
+                self.arrow.set_positions((xs[0], ys[0]), (xs[1], ys[1]))
+                self.ax.draw_artist(self.arrow)
+                if point:
+                    self.point.set_data(xs[1:], ys[1:])
+                    self.ax.draw_artist(self.point)
+            return np.array(canvas.buffer_rgba())
@@ -1,7 +1,27 @@
 #!/usr/bin/env python3
 from io import BytesIO
+from hashlib import blake2b
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import base64
+import html
+import threading
+import time
+import traceback
+import weakref
 
 import ipywidgets as widgets
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib._pylab_helpers import Gcf
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from qiskit_textbook import instrumentation
 
 
 class _pre():
@@ -20,10 +40,508 @@ class _pre():
         self.widget.value = '<pre>{}</pre>'.format(value)
 
 
+# Called as _phase_listener(name, seconds) at the end of each `_phase`, when set
+# (by the headless harness in qiskit_textbook.widgets.headless, for instance).
+_phase_listener = None
+
+
+@contextmanager
+def _phase(name):
+    """Times one phase of a widget update: 'simulate', 'format', 'draw' or 'encode'.
+    The time goes to `_phase_listener`, and to qiskit_textbook.instrumentation
+    as 'widgets.<name>' when that is enabled."""
+    if _phase_listener is None and not instrumentation.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if _phase_listener is not None:
+            _phase_listener(name, seconds)
+        instrumentation.record('widgets.' + name, seconds)
+
+
+class _transaction():
+    """
+    Batches the changes made to `widgets` in a `with` block, so that each
+    widget sends at most one update to the front end, when the block ends
+    (as with `hold_sync`). Traits that end the block with the value they
+    had at its start are not sent at all.
+
+        widgets: ipywidgets, or helpers such as _pre and _img that keep one
+                 in `.widget`.
+    """
+
+    def __init__(self, *widgets):
+        self.widgets = [getattr(widget, 'widget', widget) for widget in widgets]
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for widget in self.widgets:
+            if widget._holding_sync:
+                # an enclosing transaction sends the changes
+                continue
+            old = {}
+            def record(change, old=old):
+                old.setdefault(change['name'], change['old'])
+            widget.observe(record)
+            self._stack.callback(widget.unobserve, record)
+            self._stack.enter_context(widget.hold_sync())
+            # runs before hold_sync sends the pending changes
+            self._stack.callback(self._drop_unchanged, widget, old)
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        return False
+
+    @staticmethod
+    def _drop_unchanged(widget, old):
+        for name in list(widget._states_to_send):
+            if name in old and _same_state(widget, name, old[name], getattr(widget, name)):
+                widget._states_to_send.discard(name)
+
+
+def _same_state(widget, name, a, b):
+    """Whether `a` and `b` would be sent to the front end as the same value of trait `name`."""
+    to_json = widget.trait_metadata(name, 'to_json', widget._trait_to_json)
+    try:
+        return bool(to_json(a, widget) == to_json(b, widget))
+    except Exception:
+        return False
+
+
+class _busy():
+    """A small label that reads 'computing…' while value is True, and shows
+    the error of the last background work, if it failed, until the next."""
+
+    def __init__(self, value=False):
+        self.widget = widgets.HTML()
+        self.error = None
+        self.value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if value:
+            self._error = None
+        self._show()
+
+    @property
+    def error(self):
+        return self._error
+
+    @error.setter
+    def error(self, error):
+        self._error = error
+        self._show()
+
+    def _show(self):
+        if getattr(self, '_value', False):
+            self.widget.value = '<i>computing…</i>'
+        elif self._error is not None:
+            self.widget.value = '<span style="color: red">Error: %s</span>' % html.escape(str(self._error))
+        else:
+            self.widget.value = ''
+
+
+class _executor():
+    """
+    Runs heavy widget work away from the kernel's main thread.
+
+    `submit` runs fn(*args) in the pool chosen for `kind` (see `pools`), then
+    hands the result to `done` back on the main thread's event loop. For each
+    `owner` (usually a widget), only the result of the latest submission is
+    handed over: older ones are cancelled if they haven't started, and dropped
+    otherwise. With no running event loop (e.g. outside a kernel), or with
+    `synchronous` set, the work is done inline instead.
+
+    If the work (or `done`) raises, `busy` is cleared and the exception is given
+    to `error`, or else shown on `busy`, or else printed with its traceback to the
+    output of the cell, so that it never vanishes into the event loop's log.
+
+        pools (dict): Maps task kinds to 'thread', 'process' or 'sync'. Work
+                      sent to 'process' must be picklable.
+        max_workers (int): Size of each pool (Python's default if None).
+    """
+
+    def __init__(self, pools=None, max_workers=None):
+        if pools is None:
+            pools = {'simulate': 'thread', 'format': 'thread', 'render': 'thread',
+                     'prefetch': 'thread'}
+        self.pools = pools
+        self.max_workers = max_workers
+        self.synchronous = False
+        self._executors = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner, fn, *args, kind='render', done=None, busy=None, error=None):
+        pool = self.pools.get(kind, 'thread')
+        loop = self._running_loop()
+        if self.synchronous or loop is None or pool == 'sync':
+            result = fn(*args)
+            if done is not None:
+                done(result)
+            return
+
+        with self._lock:
+            future = self._executor(pool).submit(fn, *args)
+            previous = self._latest.get(owner)
+            self._latest[owner] = future
+        if previous is not None:
+            previous.cancel()
+        if busy is not None:
+            busy.value = True
+
+        def apply():
+            with self._lock:
+                if self._latest.get(owner) is not future:
+                    return
+                del self._latest[owner]
+            if busy is not None:
+                busy.value = False
+            try:
+                result = future.result()
+                if done is not None:
+                    done(result)
+            except Exception as exception:
+                self._failed(exception, busy, error)
+
+        def schedule(future):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(apply)
+
+        future.add_done_callback(schedule)
+
+    def stream(self, owner, render, items, done, fps=25, busy=None, error=None):
+        """
+        Like `submit`, but for animations. render(item) is called in a background
+        thread for each of `items`, and each frame is handed to `done` on the main
+        thread, at no more than `fps` frames per second. Frames are dropped (and not
+        rendered) while the stream is behind schedule, or while the main thread
+        hasn't shown the previous frame yet; the last frame is always shown.
+        New work for `owner` stops the stream, and so does an error, which is
+        reported as for `submit`.
+        """
+        items = list(items)
+        loop = self._running_loop()
+        if self.synchronous or loop is None:
+            for item in items:
+                done(render(item))
+            return
+
+        interval = 1/fps
+        shown = [0]
+        stream = []
+
+        def is_latest():
+            with self._lock:
+                return self._latest.get(owner) is stream[0]
+
+        def run():
+            start = time.perf_counter()
+            sent = 0
+            for j, item in enumerate(items):
+                last = j == len(items) - 1
+                if not is_latest():
+                    return
+                due = start + j*interval
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                if not last and (time.perf_counter() > due + interval or sent > shown[0]):
+                    continue
+                try:
+                    frame = render(item)
+                except Exception as exception:
+                    loop.call_soon_threadsafe(fail, exception)
+                    return
+                sent += 1
+                loop.call_soon_threadsafe(apply, frame, last)
+
+        def apply(frame, last):
+            with self._lock:
+                if self._latest.get(owner) is not stream[0]:
+                    return
+                if last:
+                    del self._latest[owner]
+            shown[0] += 1
+            if last and busy is not None:
+                busy.value = False
+            try:
+                done(frame)
+            except Exception as exception:
+                self.cancel(owner)
+                self._failed(exception, busy, error)
+
+        def fail(exception):
+            with self._lock:
+                if self._latest.get(owner) is not stream[0]:
+                    return
+                del self._latest[owner]
+            self._failed(exception, busy, error)
+
+        with self._lock:
+            future = self._executor('thread').submit(run)
+            stream.append(future)
+            previous = self._latest.get(owner)
+            self._latest[owner] = future
+        if previous is not None:
+            previous.cancel()
+        if busy is not None:
+            busy.value = True
+
+    def prefetch(self, owner, fn, *args):
+        """Runs fn(*args) in the background for work that nothing waits on, such
+        as filling caches. Only the latest prefetch for `owner` is kept. Without a
+        running event loop there is no background to run in, and nothing is done."""
+        if self.synchronous or self._running_loop() is None:
+            return
+        self.submit(owner, fn, *args, kind='prefetch')
+
+    def cancel(self, owner):
+        """Drops the work not yet applied for `owner`, including the rest of a stream."""
+        with self._lock:
+            future = self._latest.pop(owner, None)
+        if future is not None:
+            future.cancel()
+
+    def pending(self):
+        """Number of owners with work that hasn't been applied yet."""
+        with self._lock:
+            return len(self._latest)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executors, self._executors = self._executors, {}
+            self._latest.clear()
+        for pool in executors.values():
+            pool.shutdown(wait=wait)
+
+    def _failed(self, exception, busy, error):
+        if busy is not None:
+            busy.value = False
+        if error is not None:
+            error(exception)
+        elif busy is not None:
+            busy.error = exception
+        else:
+            traceback.print_exception(type(exception), exception, exception.__traceback__)
+
+    def _running_loop(self):
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def _executor(self, pool):
+        if pool not in self._executors:
+            if pool == 'process':
+                self._executors[pool] = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executors[pool] = ThreadPoolExecutor(self.max_workers,
+                                                           thread_name_prefix='qiskit_textbook')
+        return self._executors[pool]
+
+
+executor = _executor()
+
+
+class _lru():
+    """A thread-safe cache that drops its least recently used entries
+    beyond `maxsize`, and counts hits and misses."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+# Held whenever pyplot's global state is touched. Only figures made by
+# qiskit's drawers ever go through pyplot, and they are detached at once.
+_pyplot_lock = threading.RLock()
+
+
+def _figure(**kwargs):
+    """Creates a figure with its own Agg canvas, unknown to pyplot. Such figures
+    can be drawn and encoded in any thread, and are freed like any other object."""
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _detached(draw, *args, **kwargs):
+    """Calls a drawing function that makes its figure through pyplot (such as
+    QuantumCircuit.draw), and returns that figure detached from pyplot."""
+    with _phase('draw'), _pyplot_lock:
+        fig = draw(*args, **kwargs)
+        plt.close(fig)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class _figure_pool():
+    """
+    Keeps the figures used by the widgets from piling up in a long session.
+
+    Widgets that draw the same kind of picture on every update ask for a
+    figure by key with `get`, and are given back the same (cleared) figure
+    once the previous one has been released by `_img`. Figures from elsewhere
+    that are still open in pyplot are closed on release. Pooled figures are
+    evicted, least recently used first, whenever their estimated size goes
+    over `budget` bytes.
+    """
+
+    def __init__(self, budget=64*2**20):
+        self.budget = budget
+        self._pool = OrderedDict()
+        self._in_use = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._counts = {'created': 0, 'reused': 0, 'closed': 0, 'evicted': 0}
+        self._peak = 0
+
+    def get(self, key, **kwargs):
+        """Returns an empty figure for `key`, reusing a released one if possible.
+        Keyword arguments are passed to Figure when a new figure is needed."""
+        with self._lock:
+            fig = self._pool.pop(key, None)
+            if fig is not None:
+                self._counts['reused'] += 1
+            else:
+                self._counts['created'] += 1
+        if fig is None:
+            fig = _figure(**kwargs)
+        else:
+            fig.clear()
+        with self._lock:
+            self._in_use[fig] = key
+        return fig
+
+    def release(self, fig):
+        """Called once `fig` has been encoded. Pooled figures are made
+        available again, others are closed if pyplot still holds them."""
+        with self._lock:
+            key = self._in_use.pop(fig, None)
+            if key is not None:
+                self._pool.pop(key, None)
+                self._pool[key] = fig
+                self._enforce_budget()
+                return
+        with _pyplot_lock:
+            for manager in Gcf.get_all_fig_managers():
+                if manager.canvas.figure is fig:
+                    plt.close(fig)
+                    with self._lock:
+                        self._counts['closed'] += 1
+                    return
+
+    def clear(self):
+        """Drops all pooled figures."""
+        with self._lock:
+            self._counts['evicted'] += len(self._pool)
+            self._pool.clear()
+
+    def nbytes(self):
+        """Estimated memory held by pooled figures (the size of their RGBA buffers)."""
+        return sum(self._size(fig) for fig in list(self._pool.values()))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['pooled'] = len(self._pool)
+            stats['in_use'] = len(self._in_use)
+            stats['nbytes'] = self.nbytes()
+            stats['peak_nbytes'] = self._peak
+            stats['budget'] = self.budget
+        stats['pyplot_open'] = len(Gcf.get_all_fig_managers())
+        return stats
+
+    def _size(self, fig):
+        return int(fig.bbox.width) * int(fig.bbox.height) * 4
+
+    def _enforce_budget(self):
+        nbytes = self.nbytes()
+        self._peak = max(self._peak, nbytes)
+        # the most recently released figure is always kept
+        while nbytes > self.budget and len(self._pool) > 1:
+            _, fig = self._pool.popitem(last=False)
+            nbytes -= self._size(fig)
+            self._counts['evicted'] += 1
+
+
+figure_pool = _figure_pool()
+
+
+# matplotlib output format -> format trait of widgets.Image
+_IMAGE_FORMATS = {'png': 'png', 'svg': 'svg+xml', 'webp': 'webp'}
+
+
 class _img():
+    """
+    Shows a matplotlib figure in a widgets.Image.
+
+        value (Figure or ndarray): Figure, or RGBA image of shape (height, width, 4),
+                                   to be encoded and shown.
+        format (str): 'png', 'svg' or 'webp'.
+        dpi (float): Resolution used for encoding (matplotlib's default if None).
+        compress_level (int): zlib level 0-9 for png (Pillow's default if None).
+        quality (int): Quality 1-100 for webp (lossless if None).
+        skip_unchanged (bool): If True, encoded bytes identical to the ones
+                               already shown are not sent to the front end.
+    """
 
-    def __init__(self, value=None):
-        self.widget = widgets.Image(format='png')
+    def __init__(self, value=None, format='png', dpi=None, compress_level=None,
+                 quality=None, skip_unchanged=False):
+        if format not in _IMAGE_FORMATS:
+            raise ValueError("format must be one of %s" % ", ".join(_IMAGE_FORMATS))
+        self.format = format
+        self.dpi = dpi
+        self.compress_level = compress_level
+        self.quality = quality
+        self.skip_unchanged = skip_unchanged
+        self._digest = None
+        self.widget = widgets.Image(format=_IMAGE_FORMATS[format])
         self.value = value
 
     @property
@@ -35,8 +553,84 @@ class _img():
         self._value = value
         if value is None:
             return
+        self.data = self.encode(value)
+
+    @property
+    def data(self):
+        return self.widget.value
+
+    @data.setter
+    def data(self, data):
+        # `data` may be any bytes-like object; the widget keeps a memoryview
+        # of it, so no copy is made before it is sent to the front end.
+        if self.skip_unchanged:
+            digest = blake2b(data, digest_size=16).digest()
+            if digest == self._digest:
+                return
+            self._digest = digest
+        self.widget.value = data
+
+    def submit(self, draw, *args, busy=None, error=None):
+        """Shows the figure returned by draw(*args), drawing and encoding it
+        in the background. Only the latest submitted figure is shown. Errors
+        are reported as for `executor.submit`."""
+        def render():
+            fig = draw(*args)
+            return fig, self.encode(fig)
+        def show(result):
+            self._value, self.data = result
+        executor.submit(self, render, kind='render', done=show, busy=busy, error=error)
+
+    def encode(self, fig):
+        """Returns the encoded figure as a memoryview over the output buffer,
+        and releases the figure to figure_pool."""
+        with _phase('encode'):
+            if isinstance(fig, np.ndarray):
+                return self._encode_rgba(fig)
+            return self._encode_figure(fig)
+
+    def _encode_figure(self, fig):
+        kwargs = {'format': self.format, 'facecolor': fig.get_facecolor()}
+        if self.dpi is not None:
+            kwargs['dpi'] = self.dpi
+        if self.format == 'png' and self.compress_level is not None:
+            kwargs['pil_kwargs'] = {'compress_level': self.compress_level}
+        elif self.format == 'webp':
+            if self.quality is None:
+                kwargs['pil_kwargs'] = {'lossless': True}
+            else:
+                kwargs['pil_kwargs'] = {'quality': self.quality}
+        elif self.format == 'svg':
+            # keep the output deterministic, so that skip_unchanged works for svg
+            kwargs['metadata'] = {'Date': None}
+        data = BytesIO()
+        if self.format == 'svg':
+            # rc_context changes global state, so hold the lock while in it
+            with _pyplot_lock, matplotlib.rc_context({'svg.hashsalt': 'qiskit-textbook'}):
+                fig.savefig(data, **kwargs)
+        else:
+            fig.savefig(data, **kwargs)
+        figure_pool.release(fig)
+        return data.getbuffer()
 
+    def _encode_rgba(self, rgba):
+        image = Image.fromarray(rgba, 'RGBA')
         data = BytesIO()
-        value.savefig(data, format='png', facecolor=self.value.get_facecolor())
-        data.seek(0)
-        self.widget.value = data.read()
+        if self.format == 'webp':
+            if self.quality is None:
+                image.save(data, 'webp', lossless=True)
+            else:
+                image.save(data, 'webp', quality=self.quality)
+        elif self.format == 'svg':
+            # a raster can only be shown as svg by embedding it
+            png = BytesIO()
+            image.save(png, 'png')
+            data.write(('<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">'
+                        '<image width="{0}" height="{1}" href="data:image/png;base64,{2}"/>'
+                        '</svg>').format(image.width, image.height,
+                                         base64.b64encode(png.getvalue()).decode()).encode())
+        elif self.compress_level is not None:
+            image.save(data, 'png', compress_level=self.compress_level)
+        else:
+            image.save(data, 'png')
+        return data.getbuffer()
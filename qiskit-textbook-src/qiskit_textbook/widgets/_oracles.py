@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import numpy as np
+
+
+def _oracle_action(oracle, n):
+    """
+    Returns what the oracle does to n input qubits when its output qubit (qubit
+    n) is in |−⟩: it takes each input |x⟩ to (-1)^f(x) |π(x)⟩. Most oracles leave
+    the inputs as they are, and then π is returned as None.
+
+        oracle (QuantumCircuit): Classical oracle on n+1 qubits, built from X,
+                                 CX and CCX gates (and identities or barriers),
+                                 none of them controlled on the output qubit.
+
+        Returns:
+            (ndarray, ndarray): The signs (-1)^f(x) and the indices π(x).
+    """
+    x = np.arange(2**n, dtype=np.int64)
+    for gate, qargs, _ in oracle.data:
+        qubits = [oracle.qubits.index(q) for q in qargs]
+        if gate.name in ('id', 'barrier'):
+            continue
+        if gate.name not in ('x', 'cx', 'ccx', 'mcx'):
+            raise ValueError("Only oracles of X, CX and CCX gates can be computed analytically, not '%s'" % gate.name)
+        *controls, target = qubits
+        if n in controls:
+            raise ValueError("Oracles controlled on their output qubit can't be computed analytically")
+        flip = np.ones_like(x)
+        for control in controls:
+            flip &= x >> control
+        x ^= (flip & 1) << target
+    signs = 1.0 - 2*((x >> n) & 1)
+    permutation = x & (2**n - 1)
+    if np.array_equal(permutation, np.arange(2**n)):
+        permutation = None
+    return signs, permutation
+
+
+def _walsh_hadamard(psi):
+    """Applies H to every qubit of the state `psi` (in place), in O(n 2^n)."""
+    h = 1
+    while h < len(psi):
+        pairs = psi.reshape(-1, 2, h)
+        first = pairs[:, 0, :].copy()
+        pairs[:, 0, :] += pairs[:, 1, :]
+        pairs[:, 1, :] *= -1
+        pairs[:, 1, :] += first
+        h *= 2
+    psi *= 1/np.sqrt(len(psi))
+    return psi
+
+
+class _phase_register():
+    """
+    The n input qubits of Deutsch-Jozsa style circuits, with the output qubit
+    held in |−⟩, so that each query of the oracle is the phase mask `signs`
+    (followed by `permutation`, for oracles that also change their inputs).
+    The amplitudes are real throughout, and each step costs O(n 2^n) at most,
+    instead of a simulation of the circuit.
+
+        signs (ndarray): (-1)^f(x) for each input x, as from `_oracle_action`.
+        permutation (ndarray): Where the oracle takes each input x, if not to itself.
+    """
+
+    def __init__(self, signs, permutation=None):
+        self.signs = np.asarray(signs, dtype=float)
+        self.permutation = permutation
+        self.n = int(np.log2(len(self.signs)))
+        self.reset()
+
+    def reset(self):
+        self.psi = np.zeros(2**self.n)
+        self.psi[0] = 1
+
+    def hadamards(self):
+        _walsh_hadamard(self.psi)
+
+    def oracle(self):
+        self.psi *= self.signs
+        if self.permutation is not None:
+            psi = np.empty_like(self.psi)
+            psi[self.permutation] = self.psi
+            self.psi = psi
+
+    def copy(self):
+        register = _phase_register.__new__(_phase_register)
+        register.signs, register.permutation, register.n = self.signs, self.permutation, self.n
+        register.psi = self.psi.copy()
+        return register
+
+    def statevector(self):
+        """The state of all n+1 qubits, in Qiskit's ordering (output qubit last)."""
+        return np.concatenate([self.psi, -self.psi])/np.sqrt(2)
+
+
+class _bv_register():
+    """
+    The n input qubits of the Bernstein-Vazirani circuit, tracked symbolically.
+
+    Starting from |0…0⟩, H⊗ⁿ and the oracle only ever leave the register in a
+    state ±|a⟩ ('basis'), or ±2^(-n/2) Σ_x (-1)^(a·x) |x⟩ ('fourier'). H⊗ⁿ swaps
+    the two forms, and the oracle gives a basis state the sign (-1)^(s·a) or
+    turns fourier state a into fourier state a⊕s. Each step is O(1), for any n.
+
+        n (int): Number of input qubits.
+        s (int): The hidden string, with bit q for qubit q.
+    """
+
+    def __init__(self, n, s):
+        self.n = n
+        self.s = s
+        self.reset()
+
+    def reset(self):
+        self.sign, self.kind, self.a = 1, 'basis', 0
+
+    def hadamards(self):
+        self.kind = 'fourier' if self.kind == 'basis' else 'basis'
+
+    def oracle(self):
+        if self.kind == 'basis':
+            self.sign *= (-1)**bin(self.s & self.a).count('1')
+        else:
+            self.a ^= self.s
+
+    def copy(self):
+        register = _bv_register(self.n, self.s)
+        register.sign, register.kind, register.a = self.sign, self.kind, self.a
+        return register
+
+    def statevector(self):
+        """The state of all n+1 qubits, in Qiskit's ordering (output qubit last).
+        This takes O(2^n) memory, so is only for small n."""
+        if self.kind == 'basis':
+            psi = np.zeros(2**self.n)
+            psi[self.a] = self.sign
+        else:
+            x = np.arange(2**self.n)
+            parity = np.zeros(2**self.n, dtype=np.int64)
+            for q in range(self.n):
+                parity ^= (x >> q) & (self.a >> q) & 1
+            psi = self.sign*(1 - 2.0*parity)/np.sqrt(2**self.n)
+        return np.concatenate([psi, -psi])/np.sqrt(2)
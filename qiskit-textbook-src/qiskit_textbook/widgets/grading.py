@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Grades answers to `state_vector_exercise` in bulk, with the same verdicts the
+widget gives.
+
+Submissions repeat the same few expressions ('1/sqrt(2)', '0', ...) over and
+over, so each distinct expression is evaluated once and cached, and the checks
+of normalization and target probability are then done for all submissions at
+once, with NumPy.
+
+    python -m qiskit_textbook.widgets.grading answers.csv --target 0.5 --output verdicts.jsonl
+
+The input is a .csv or .jsonl file with an 'answer' for each submission, and
+optionally an 'id' and a 'target' (which overrides --target), or a text file
+with one answer per line.
+"""
+import argparse
+import csv
+import json
+import sys
+
+import numexpr
+import numpy as np
+
+from qiskit_textbook.widgets._helpers import _lru
+
+# expression -> (value, error message)
+_expressions = _lru(4096)
+
+
+def _evaluate(expression):
+    """The value of one component of an answer, as state_vector_exercise evaluates it."""
+    result = _expressions.get(expression)
+    if result is None:
+        try:
+            result = (numexpr.evaluate(expression, local_dict={}, global_dict={'pi': np.pi}), None)
+        except Exception as e:
+            result = (None, str(e).split("(")[0])
+        _expressions.put(expression, result)
+    return result
+
+
+def _parse_state_vector(answer):
+    """
+    Evaluates an answer such as '[1/sqrt(2), 1j/sqrt(2)]'.
+
+        Returns:
+            (value, value, str): Its two amplitudes, or None and an error message.
+    """
+    components = answer.strip("[]").replace(" ", "").split(",")
+    c1, error = _evaluate(components[0])
+    if error is None and len(components) < 2:
+        # what indexing the missing component would say
+        error = "list index out of range"
+    if error is None:
+        c2, error = _evaluate(components[1])
+    if error is not None:
+        return None, None, error
+    return c1, c2, None
+
+
+def _verdict(c1, target, squared_magnitude, correct):
+    if correct:
+        return "Correct!"
+    if not (squared_magnitude < 1.01 and squared_magnitude > .99): # Close Enough
+        return "Magnitude is not equal to 1"
+    return "The absolute value of " + str(c1) + ", squared is not equal to " + str(target)
+
+
+def grade_state_vectors(answers, target):
+    """
+    Grades answers to state_vector_exercise(target).
+
+        answers (list): The answers, as typed into the exercise.
+        target (float or list): Target probability of measuring 0, for all
+                                answers or for each.
+
+        Returns:
+            list: A dict for each answer, with 'correct' (bool) and 'message'
+                  (the exercise's response to it).
+    """
+    parsed = [_parse_state_vector(answer) for answer in answers]
+    valid = [j for j, (_, _, error) in enumerate(parsed) if error is None]
+    targets = np.broadcast_to(np.asarray(target, dtype=float), (len(answers),))
+
+    c1 = np.array([parsed[j][0] for j in valid], dtype=complex)
+    c2 = np.array([parsed[j][1] for j in valid], dtype=complex)
+    t = targets[valid]
+    p = np.abs(c1)**2
+    squared_magnitude = p + np.abs(c2)**2
+    normalized = (squared_magnitude < 1.01) & (squared_magnitude > .99)
+    correct = normalized & (p > t*0.99) & (p < t*1.01)
+
+    verdicts = [{'correct': False, 'message': error} for _, _, error in parsed]
+    for k, j in enumerate(valid):
+        verdicts[j] = {'correct': bool(correct[k]),
+                       'message': _verdict(parsed[j][0], target if np.ndim(target) == 0 else targets[j],
+                                           squared_magnitude[k], correct[k])}
+    return verdicts
+
+
+def _read_submissions(path):
+    if path.endswith('.csv'):
+        with open(path, newline='') as file:
+            return list(csv.DictReader(file))
+    with open(path) as file:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in file if line.strip()]
+        return [{'answer': line.rstrip('\n')} for line in file if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('answers', help='.csv, .jsonl or text file of answers')
+    parser.add_argument('--target', type=float, help="target probability, for answers with no 'target'")
+    parser.add_argument('--output', help='JSON Lines file for the verdicts (default: stdout)')
+    args = parser.parse_args(argv)
+
+    submissions = _read_submissions(args.answers)
+    targets = [args.target if submission.get('target') in (None, '') else submission['target']
+               for submission in submissions]
+    if None in targets:
+        parser.error("--target is needed for answers with no 'target'")
+    verdicts = grade_state_vectors([submission['answer'] for submission in submissions], targets)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for j, (submission, verdict) in enumerate(zip(submissions, verdicts)):
+            output.write(json.dumps(dict(id=submission.get('id', j), **verdict)) + '\n')
+    finally:
+        if args.output:
+            output.close()
+    print("%i of %i correct" % (sum(verdict['correct'] for verdict in verdicts), len(verdicts)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
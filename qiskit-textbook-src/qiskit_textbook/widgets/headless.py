@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Drives the widgets in qiskit_textbook.widgets without a browser or a kernel,
+and measures how long their callbacks take.
+
+Each widget is created with `display` replaced by a stub that keeps the
+widgets it is given. Button clicks and value changes are then fired on
+those widgets directly, as the front end would, and timed. The time spent
+in each phase of an update ('simulate', 'format', 'draw' and 'encode') is
+recorded too. With no event loop running, the widgets do all their work
+inside the callback, so the measured latency covers the whole update.
+
+    python -m qiskit_textbook.widgets.headless --repeat 20 --output latency.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import ipywidgets as widgets
+
+import qiskit_textbook.widgets as textbook_widgets
+from qiskit_textbook.widgets import _helpers
+
+
+class widget_driver():
+    """
+    Creates a widget against a stub display, and fires events on its controls.
+
+        widget (callable): Function that displays the widget, e.g. `gate_demo`.
+        args, kwargs: Passed on to `widget`.
+    """
+
+    def __init__(self, widget, *args, **kwargs):
+        self.name = widget.__name__
+        self.displayed = []
+        self.records = []
+
+        def display(*objs, **kwargs):
+            self.displayed.extend(objs)
+
+        stubs = {'display': display, 'clear_output': lambda *a, **k: None}
+        originals = {name: getattr(textbook_widgets, name) for name in stubs}
+        for name, stub in stubs.items():
+            setattr(textbook_widgets, name, stub)
+        try:
+            self._timed('create', widget, *args, **kwargs)
+        finally:
+            for name, original in originals.items():
+                setattr(textbook_widgets, name, original)
+
+    def controls(self, cls=widgets.Widget):
+        """All displayed widgets of type `cls`, including nested ones, in display order."""
+        found = []
+        def walk(objs):
+            for obj in objs:
+                if isinstance(obj, cls):
+                    found.append(obj)
+                walk(getattr(obj, 'children', ()))
+        walk(self.displayed)
+        return found
+
+    def find(self, cls, description=None, index=0):
+        matches = [w for w in self.controls(cls)
+                   if description is None or getattr(w, 'description', None) == description]
+        if len(matches) <= index:
+            raise LookupError("No widget with description %r" % description)
+        return matches[index]
+
+    def click(self, description, index=0):
+        """Clicks the button with the given description (toggling it, for ToggleButtons)."""
+        button = self.find((widgets.Button, widgets.ToggleButton), description, index)
+        if isinstance(button, widgets.Button):
+            self._timed('click ' + description, button.click)
+        else:
+            self._timed('click ' + description, setattr, button, 'value', not button.value)
+
+    def set(self, cls, value, index=0, description=None):
+        """Sets the value of a control, e.g. set(widgets.IntSlider, 5)."""
+        control = self.find(cls, description, index)
+        self._timed('set %s' % cls.__name__, setattr, control, 'value', value)
+
+    def _timed(self, action, fn, *args, **kwargs):
+        phases = {}
+        def listener(name, seconds):
+            phases[name] = phases.get(name, 0.0) + seconds
+        previous, _helpers._phase_listener = _helpers._phase_listener, listener
+        start = time.perf_counter()
+        try:
+            fn(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            _helpers._phase_listener = previous
+        self.records.append({'widget': self.name, 'action': action,
+                             'total': total, 'phases': phases})
+
+
+def _binary_widget(driver):
+    for description in ['16', '4', '1', '4']:
+        driver.click(description)
+
+
+def _bloch_calc(driver):
+    for theta, phi in [('pi/2', '0'), ('pi/4', 'pi/2'), ('pi', 'pi/3')]:
+        driver.controls(widgets.Text)[0].value = theta
+        driver.controls(widgets.Text)[1].value = phi
+        driver.click('Plot')
+
+
+def _scalable_circuit(driver):
+    for n in [2, 6, 8, 1]:
+        driver.set(widgets.IntSlider, n)
+
+
+def _gate_demo(driver):
+    for description in ['H', 'S', 'T', 'X', 'Tdg', 'Sdg', 'H', 'P', 'Reset']:
+        driver.click(description)
+
+
+def _oracle_steps(driver):
+    for description in ['H⊗ⁿ', 'Oracle', 'H⊗ⁿ', 'Clear']:
+        driver.click(description)
+
+
+def _ghz(qc, n):
+    qc.h(0)
+    for q in range(n - 1):
+        qc.cx(q, q + 1)
+
+
+# name -> (widget, args, kwargs, script)
+SCENARIOS = {
+    'binary_widget': (textbook_widgets.binary_widget, (), {}, _binary_widget),
+    'bloch_calc': (textbook_widgets.bloch_calc, (), {}, _bloch_calc),
+    'scalable_circuit': (textbook_widgets.scalable_circuit, (_ghz,), {}, _scalable_circuit),
+    'gate_demo': (textbook_widgets.gate_demo, (), {}, _gate_demo),
+    'gate_demo_qsphere': (textbook_widgets.gate_demo, (), {'qsphere': True}, _gate_demo),
+    'bv_widget': (textbook_widgets.bv_widget, (10, '1011010011'), {}, _oracle_steps),
+    'dj_widget': (textbook_widgets.dj_widget, (), {'size': 'large'}, _oracle_steps),
+}
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples)*1000
+    return {'n': len(samples),
+            'mean_ms': float(np.mean(samples)),
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p90_ms': float(np.percentile(samples, 90)),
+            'p99_ms': float(np.percentile(samples, 99)),
+            'max_ms': float(np.max(samples))}
+
+
+def summarize(records):
+    """Percentile summaries of latency records, per widget and action, with
+    one summary for the total and one for each phase."""
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record['widget'], {}).setdefault(record['action'], []).append(record)
+    summary = {}
+    for widget, actions in grouped.items():
+        summary[widget] = {}
+        for action, group in actions.items():
+            phases = sorted({name for record in group for name in record['phases']})
+            summary[widget][action] = {
+                'total': _percentiles([record['total'] for record in group]),
+                'phases': {name: _percentiles([record['phases'].get(name, 0.0) for record in group])
+                           for name in phases}
+            }
+    return summary
+
+
+def run(scenarios=None, repeat=5):
+    """
+    Runs the scripted interactions for the given scenarios (all of SCENARIOS if None),
+    `repeat` times each.
+
+        Returns:
+            dict: {'records': [...], 'summary': {...}}
+    """
+    records = []
+    for name in scenarios or SCENARIOS:
+        widget, args, kwargs, script = SCENARIOS[name]
+        for _ in range(repeat):
+            driver = widget_driver(widget, *args, **kwargs)
+            script(driver)
+            for record in driver.records:
+                record['widget'] = name
+            records += driver.records
+    return {'records': records, 'summary': summarize(records)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', nargs='*',
+                        help='scenarios to run, from %s (default: all)' % ', '.join(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='JSON file for the results (default: stdout)')
+    parser.add_argument('--no-records', action='store_true',
+                        help='only write the percentile summary')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error("unknown scenario%s: %s" % ('s'*(len(unknown) > 1), ', '.join(unknown)))
+
+    import matplotlib
+    matplotlib.use('Agg')
+    results = run(args.scenarios, args.repeat)
+    if args.no_records:
+        del results['records']
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+
+
+if __name__ == '__main__':
+    main()